@@ -0,0 +1,281 @@
+"""
+Time loading, eagerly, lazily and from a snapshot, expansion, completion,
+help and dispatch on a large synthetic command tree, mutable and frozen.
+
+    python benchmarks/bench_cli.py [-n COMMANDS] [--json OUT] [--compare OLD]
+
+``--json`` writes the results for later runs to ``--compare`` against,
+e.g. one file per release. Exits with status 1 if a phase on the frozen
+tree is slower than on the mutable one, beyond ``--tolerance``.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+
+# Run from a checkout without installing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_freeze import deep_sizeof
+from iscli.cli import Cli, CommandSet
+
+
+def handler(cli, args):
+    pass
+
+
+class NullStream(object):
+    def write(self, data):
+        pass
+
+
+# Command shapes, each with a spec, help and a function making a line
+# that runs the i-th command of that shape
+SHAPES = [
+    # Deep keyword chain
+    ('deep%(i)d ' + ' '.join('level%d' % l for l in xrange(8)) +
+     ' leaf%(j)d',
+     None,
+     lambda i, j: 'deep%d %s leaf%d' % (
+         i, ' '.join('level%d' % l for l in xrange(8)), j)),
+    # Wide fan-out below a few verbs
+    ('wide%(v)d object%(i)d attribute%(j)d (detail|)',
+     None,
+     lambda i, j: 'wide%d object%d attribute%d detail' % (i % 20, i, j)),
+    # Brace group of options
+    ('mount%(i)d HOST {ro | uid <1-100> | sync | noexec} (now|)',
+     None,
+     lambda i, j: 'mount%d host%d noexec uid %d ro now' % (i, j, j % 100 + 1)),
+    # Range and variable converters
+    ('set%(i)d value%(j)d <1-65535> NAME (<1-10>|)',
+     None,
+     lambda i, j: 'set%d value%d %d name%d 5' % (i, j, j + 1, j)),
+    # Varargs
+    ('echo%(i)d text%(j)d .WORD',
+     None,
+     lambda i, j: 'echo%d text%d %s' % (
+         i, j, ' '.join('word%d' % w for w in xrange(10)))),
+]
+
+# Commands sharing a first keyword per shape, bounds the root fan-out
+PER_HEAD = 10
+
+
+def make_commands(count):
+    """Return a CommandSet of ``count`` commands of every shape, and a
+    command line running each of them"""
+    commands = CommandSet()
+    lines = []
+    for n in xrange(count):
+        spec, desc, line = SHAPES[n % len(SHAPES)]
+        k = n // len(SHAPES)
+        i, j = k // PER_HEAD, k % PER_HEAD
+        commands.add(handler, spec % {'i': i, 'j': j, 'v': i % 20}, desc)
+        lines.append(line(i, j))
+    return commands, lines
+
+
+def abbreviate(line):
+    """Shorten the keywords without a number, which are still unambiguous
+    at three letters"""
+    return ' '.join(w[:3] if w.isalpha() else w for w in line.split())
+
+
+def best_of(fn, args, repeat):
+    """Best time per call in microseconds over ``repeat`` passes"""
+    times = []
+    for _ in xrange(repeat):
+        start = time.time()
+        for arg in args:
+            fn(arg)
+        times.append(time.time() - start)
+    return min(times) / len(args) * 1e6
+
+
+def run_phases(cli, lines, repeat):
+    def expand(line):
+        assert len(cli.expand(cli.parse(line))) == 1, line
+
+    def walk(line):
+        # Without the expansions kept from earlier calls
+        cli.tree_changed()
+        expand(line)
+
+    def complete(line):
+        cli.complete(line, '')
+
+    def describe(line):
+        cli.describe(line)
+
+    def command(line):
+        cli.command(line)
+
+    def interactive(line):
+        # Help at the end of the line, then enter
+        cli.describe(line + ' ')
+        cli.command(line)
+
+    # Completion and help are asked for partway through a line
+    partial = [line.rsplit(' ', 2)[0] + ' ' for line in lines]
+    return {
+        'expand': best_of(expand, lines, repeat),
+        'walk': best_of(walk, lines, repeat),
+        'expand_abbreviated': best_of(
+            expand, [abbreviate(l) for l in lines], repeat),
+        'complete': best_of(complete, partial, repeat),
+        'describe': best_of(describe, partial, repeat),
+        'command': best_of(command, lines, repeat),
+        'interactive': best_of(interactive, lines, repeat),
+    }
+
+
+def max_rss():
+    """Peak resident size of this process in bytes"""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'describe', '--always', '--dirty'],
+            stderr=open(os.devnull, 'w')).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(count, samples, repeat):
+    commands, lines = make_commands(count)
+    lines = random.Random(0).sample(lines, min(samples, len(lines)))
+
+    rss_before = max_rss()
+    load = min(timeit.repeat(lambda: Cli(command_sets=[commands]),
+                             number=1, repeat=repeat))
+    cli = Cli(command_sets=[commands])
+    cli.stdout = NullStream()
+    rss_loaded = max_rss()
+
+    cache = tempfile.mkdtemp()
+    try:
+        snapshot = os.path.join(cache, 'tree')
+        Cli(command_sets=[commands], cache=snapshot)
+        load_snapshot = min(timeit.repeat(
+            lambda: Cli(command_sets=[commands], cache=snapshot),
+            number=1, repeat=repeat))
+    finally:
+        shutil.rmtree(cache)
+
+    load_lazy = min(timeit.repeat(
+        lambda: Cli(command_sets=[commands], lazy=True),
+        number=1, repeat=repeat))
+    lazy_size = deep_sizeof(Cli(command_sets=[commands], lazy=True).root)
+
+    results = {'load': load * 1e6, 'load_snapshot': load_snapshot * 1e6,
+               'load_lazy': load_lazy * 1e6}
+    mutable_size = deep_sizeof(cli.root)
+    for name, value in run_phases(cli, lines, repeat).items():
+        results[name] = value
+
+    start = time.time()
+    cli.freeze()
+    results['freeze'] = (time.time() - start) * 1e6
+    for name, value in run_phases(cli, lines, repeat).items():
+        results['frozen_' + name] = value
+
+    return {
+        'meta': {
+            'commands': count,
+            'samples': len(lines),
+            'repeat': repeat,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'revision': revision(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        # Microseconds per call
+        'timings': results,
+        # Bytes
+        'memory': {
+            'tree': mutable_size,
+            'lazy_tree': lazy_size,
+            'frozen_tree': deep_sizeof(cli.root),
+            'load_peak_rss_growth': rss_loaded - rss_before,
+            'peak_rss': max_rss(),
+        },
+    }
+
+
+def report(results, old=None):
+    def row(name, value, unit, scale, old_value):
+        line = '%-26s %10.1f %s' % (name, value / scale, unit)
+        if old_value:
+            line += '   %6.2fx' % (value / float(old_value))
+        print(line)
+
+    meta = results['meta']
+    print('%(commands)d commands, %(samples)d lines, best of %(repeat)d, '
+          'Python %(python)s' % meta)
+    for name, value in sorted(results['timings'].items()):
+        old_value = old and old['timings'].get(name)
+        if name in ('load', 'load_lazy', 'load_snapshot', 'freeze'):
+            row(name, value, 'ms', 1e3, old_value)
+        else:
+            row(name, value, 'us', 1, old_value)
+    for name, value in sorted(results['memory'].items()):
+        row(name, value, 'MiB', 1048576.0, old and old['memory'].get(name))
+
+
+def slower_frozen(results, tolerance):
+    """Names of the phases slower on the frozen tree than on the mutable
+    one by more than ``tolerance``, a fraction"""
+    timings = results['timings']
+    return sorted(name for name, value in timings.items()
+                  if name.startswith('frozen_') and
+                  value > timings[name[len('frozen_'):]] * (1 + tolerance))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('-n', '--commands', type=int, default=10000)
+    parser.add_argument('-s', '--samples', type=int, default=500,
+                        help='command lines timed per phase')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('--json', metavar='OUT',
+                        help='write the results as JSON')
+    parser.add_argument('--compare', metavar='OLD',
+                        help='JSON results of an earlier run to compare to')
+    parser.add_argument('-t', '--tolerance', type=float, default=0.1,
+                        help='frozen phases may be this much slower, '
+                             'for timing noise (default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    results = run(args.commands, args.samples, args.repeat)
+    old = None
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+    report(results, old)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    slower = slower_frozen(results, args.tolerance)
+    if slower:
+        print('Slower on the frozen tree: %s' % ', '.join(slower))
+        return 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
+
@@ -0,0 +1,65 @@
+"""
+Memory used by a 10k command tree, before and after :meth:`Cli.freeze`.
+
+    python benchmarks/bench_freeze.py [commands]
+"""
+from __future__ import print_function
+
+import gc
+import os
+import sys
+import types
+
+# Run from a checkout without installing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iscli.cli import Cli, CommandSet
+
+
+def handler(cli, args):
+    pass
+
+
+def make_commands(count):
+    commands = CommandSet()
+    for i in xrange(count):
+        commands.add(
+            handler,
+            'verb%d object%d attribute%d (NAME|<1-100>|) (detail|)' % (
+                i % 20, i % 400, i),
+            ['Verb', 'Object', 'Attribute', 'Name', 'Number', 'Detail'],
+        )
+    return commands
+
+
+def deep_sizeof(root):
+    """Size in bytes of every object reachable from root, excluding code"""
+    skip = (type, types.FunctionType, types.ModuleType, types.CodeType,
+            types.BuiltinFunctionType)
+    seen = set()
+    stack = [root]
+    total = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, skip):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        stack.extend(gc.get_referents(obj))
+    return total
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 10000
+    cli = Cli(command_sets=[make_commands(count)])
+    before = deep_sizeof(cli.root)
+    cli.freeze()
+    after = deep_sizeof(cli.root)
+    print('commands: %d' % count)
+    print('mutable tree: %.1f MiB' % (before / 1048576.0))
+    print('frozen tree:  %.1f MiB (%.0f%%)' % (
+        after / 1048576.0, 100.0 * after / before))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,48 @@
+"""
+Interpreter startup time for non-interactive and interactive use.
+
+    python benchmarks/bench_startup.py [runs]
+"""
+from __future__ import print_function
+
+import os
+import subprocess
+import sys
+import time
+
+
+CASES = [
+    ('python', 'pass'),
+    ('import iscli.cli', 'import iscli.cli'),
+    ('run one command', '\n'.join([
+        'from iscli.cli import Cli, CommandSet',
+        'cs = CommandSet()',
+        'cs.add(lambda cli, args: None, "show version", None)',
+        'Cli(command_sets=[cs]).command("sh ver")',
+    ])),
+    ('import iscli.linenoise', 'import iscli.linenoise'),
+]
+
+
+def timeit(code, runs):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(os.path.abspath(__file__)))] +
+        [p for p in [env.get('PYTHONPATH')] if p])
+    best = None
+    for _ in xrange(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    runs = int(argv[1]) if len(argv) > 1 else 10
+    for name, code in CASES:
+        print('%-24s %7.1f ms' % (name, timeit(code, runs) * 1000))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
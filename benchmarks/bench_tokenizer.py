@@ -0,0 +1,39 @@
+"""
+iscli.tokenizer against shlex.split on long command lines.
+
+    python benchmarks/bench_tokenizer.py
+"""
+from __future__ import print_function
+
+import os
+import shlex
+import sys
+import timeit
+
+# Run from a checkout without installing
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from iscli.tokenizer import split, tokenize
+
+
+LINES = {
+    'plain': ' '.join('word%d' % i for i in xrange(200)),
+    'quoted': ' '.join('"quoted %d" \'single\' esc\\ aped' % i
+                       for i in xrange(50)),
+}
+
+
+def main():
+    for name, line in sorted(LINES.items()):
+        assert tuple(shlex.split(line)) == split(line)
+        for fn in (shlex.split, split, tokenize):
+            number = 200
+            best = min(timeit.repeat(lambda: fn(line), number=number,
+                                     repeat=5))
+            print('%-8s %5d chars  %-15s %8.1f us' % (
+                name, len(line), fn.__module__ + '.' + fn.__name__,
+                best / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
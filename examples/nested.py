@@ -5,11 +5,12 @@ from iscli.exceptions import ExitLoop
 commands = CommandSet()
 enable_commands = CommandSet()
 conf_commands = CommandSet()
+common_commands = CommandSet()
 
 
 @commands.install('enable')
 def cmd_enable(cli, args):
-    cli.enable_mode.commandloop()
+    cli.enter_mode('enable')
 
 
 @enable_commands.install('disable')
@@ -17,33 +18,37 @@ def cmd_disable(cli, args):
     raise ExitLoop()
 
 
-@enable_commands.install('show system')
-def cmd_show_system(cli, args):
-    print 'System OK'
-
-
 @enable_commands.install('configure terminal')
 def cmd_configure_terminal(cli, args):
-    cli.conf_mode.commandloop()
+    cli.enter_mode('configure')
 
 
-@enable_commands.install('exit')
-@conf_commands.install('exit')
-@conf_commands.install('end')
+@common_commands.install('show system')
+def cmd_show_system(cli, args):
+    cli.out('System OK')
+
+
+@common_commands.install('exit')
 def cmd_exit(cli, args):
     raise ExitLoop()
 
 
+@conf_commands.install('end')
+def cmd_end(cli, args):
+    cli.exit_mode('enable')
+
+
 @conf_commands.install('hello world')
 def cmd_hello_world(cli, args):
-    print 'Hello World!'
+    cli.out('Hello World!')
 
 
 if __name__ == '__main__':
     cli = Cli('>')
     cli.load(commands)
-    enable_cli = cli.enable_mode = Cli('#')
-    enable_cli.load(enable_commands)
-    conf_cli = enable_cli.conf_mode = Cli('(conf)#')
-    conf_cli.load(conf_commands)
+    cli.add_mode('enable', '#')
+    cli.add_mode('configure', '(conf)#')
+    cli.load(common_commands, mode=['enable', 'configure'])
+    cli.load(enable_commands, mode='enable')
+    cli.load(conf_commands, mode='configure')
     cli.commandloop()
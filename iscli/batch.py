@@ -0,0 +1,163 @@
+"""
+iscli.batch
+~~~~~~~~~~~
+
+Run scripts with the commands registered as safe running concurrently,
+see :meth:`Cli.run_batch`.
+
+A safe command only reads state, such as a ``show`` command waiting on a
+daemon, so it can run alongside other safe commands::
+
+    @commands.install('show routes', safe=True)
+    def show_routes(cli, args):
+        ...
+
+Runs of consecutive safe commands are handed to a pool, each with a
+session of its own writing to a buffer. Any other line is a barrier: it
+waits for the commands before it, runs on the Cli itself, and the lines
+after it are only resolved once it is done, so a command entering a mode
+affects the lines that follow as usual.
+
+The output of each command is written out in script order once it and
+every command before it are done.
+"""
+import time
+from StringIO import StringIO
+from functools import partial
+from itertools import izip
+
+from .cli import ScriptError, ScriptResult, script_lines
+from .exceptions import CommandError, ExitLoop
+
+
+def _error(e, line):
+    # Same messages as Cli.run_script
+    if isinstance(e, CommandError):
+        return '%s: %s' % (e.__class__.__name__, line)
+    return '%s: %s' % (e.__class__.__name__, e)
+
+
+def _call(cli, fn, args, line):
+    """Run a resolved command, returning its output and error message"""
+    try:
+        cli.call(fn, args)
+    except ExitLoop:
+        raise
+    except Exception as e:
+        return cli.stdout.getvalue(), _error(e, line)
+    return cli.stdout.getvalue(), None
+
+
+def _run_in_thread(cli, item):
+    _, line, fn, args = item
+    return _call(cli.session(StringIO()), fn, args, line)
+
+
+# Cli of a forked worker process
+_process_cli = None
+
+
+def _init_process(cli):
+    global _process_cli
+    _process_cli = cli
+
+
+def _run_in_process(line):
+    # Handlers do not pickle, the line is resolved again in the copy of
+    # the Cli forked with the pool
+    session = _process_cli.session(StringIO())
+    try:
+        fn, args = session.resolve(line)
+    except CommandError as e:
+        return '', _error(e, line)
+    return _call(session, fn, args, line)
+
+
+def run_batch(cli, script, workers=4, processes=False, stop_on_error=True):
+    """See :meth:`Cli.run_batch`"""
+    if isinstance(script, basestring):
+        with open(script) as f:
+            return run_batch(cli, f, workers, processes, stop_on_error)
+
+    outputs = []
+    errors = []
+    start = time.time()
+
+    def emit(group, results):
+        # Write out results in order, False once a line has failed
+        for (lineno, line, _, _), (output, error) in izip(group, results):
+            cli.stdout.write(output)
+            outputs.append(output)
+            if error is not None:
+                errors.append(ScriptError(lineno, line, error))
+                if stop_on_error:
+                    return False
+        return True
+
+    pool = None
+    safe = []
+    try:
+        for lineno, line in script_lines(script):
+            try:
+                fn, args, handler = cli._resolve(line)
+            except Exception as e:
+                fn, args, handler, error = None, None, None, _error(e, line)
+
+            if handler in cli.safe_handlers:
+                safe.append((lineno, line, fn, args))
+                continue
+
+            # A barrier, let the safe commands before it finish first
+            if safe:
+                pool, ok = _run_safe(cli, safe, pool, workers, processes,
+                                     emit)
+                safe = []
+                if not ok:
+                    break
+
+            if fn is None:
+                result = ('', error)
+            else:
+                stdout, pager = cli.stdout, cli.pager
+                cli.stdout, cli.pager = StringIO(), None
+                try:
+                    result = _call(cli, fn, args, line)
+                finally:
+                    cli.stdout, cli.pager = stdout, pager
+            if not emit([(lineno, line, fn, args)], [result]):
+                break
+        else:
+            if safe:
+                pool, _ = _run_safe(cli, safe, pool, workers, processes,
+                                    emit)
+    except ExitLoop:
+        pass
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    return ScriptResult(len(outputs), errors, time.time() - start,
+                        outputs)
+
+
+def _run_safe(cli, group, pool, workers, processes, emit):
+    """Run safe commands on the pool, returning the pool to use next and
+    whether to carry on"""
+    if processes:
+        from multiprocessing import Pool
+        # Forked now, so the workers see what the barriers before did
+        pool = Pool(min(workers, len(group)), _init_process, (cli,))
+        try:
+            results = pool.imap(
+                _run_in_process, [line for _, line, _, _ in group])
+            return None, emit(group, results)
+        finally:
+            pool.terminate()
+            pool.join()
+
+    if pool is None:
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+    results = pool.imap(partial(_run_in_thread, cli), group)
+    return pool, emit(group, results)
@@ -1,16 +1,28 @@
 from __future__ import print_function
 
-import shlex
+import collections
+import copy
 import sys
-
-from .exceptions import ExitLoop
-from .node import cmdsplit, make_root
-from . import linenoise
+import time
+import types
+from functools import partial
+
+from .completion import CompletionCache
+from .cursor import Cursor, Expansion
+from .exceptions import (
+    AmbiguousCommand, CommandCancelled, CommandError, ExitLoop, InvalidPipe,
+    UnrecognizedCommand
+)
+from . import pipes
+from .node import FrozenNode, cmdsplit, freeze, is_lazy_spec, make_root
+from .task import CommandTask, current_task
+from .tokenizer import split, tokenize
 
 
 class CommandSet(object):
     def __init__(self):
         self.commands = {}
+        self.completers = {}
         self._on_load = None
 
     def add(self, fn, cmdspec, desc, **options):
@@ -27,6 +39,17 @@ class CommandSet(object):
             return fn
         return decorator
 
+    def completer(self, keyword):
+        """A decorator to install a completion provider into the
+        CommandSet, see :meth:`Cli.add_completer`.
+
+        :param keyword: keyword of the argument elements to complete
+        """
+        def decorator(fn):
+            self.completers[keyword] = fn
+            return fn
+        return decorator
+
     def on_load(self, fn):
         """A decorator to set a callback to be run when this CommandSet
         is loaded by a Cli
@@ -36,96 +59,476 @@ class CommandSet(object):
         self._on_load = fn
         return fn
 
-    def load_into(self, cli):
-        """Load this CommandSet into a Cli."""
+    def load_into(self, cli, prebuilt=False, lazy=False):
+        """Load this CommandSet into a Cli.
+
+        :param prebuilt: the commands without a mode are already in the
+                         tree, see :mod:`iscli.snapshot`
+        :param lazy: build each command's subtree on first use, see
+                     :meth:`Cli.register`
+        """
         for args, options in self.commands.itervalues():
+            if prebuilt and options.get('mode') is None:
+                # Only what register records outside the tree is left
+                if options.get('safe'):
+                    cli._add_safe_handler(args[0])
+                continue
+            if lazy:
+                options = dict(options, lazy=True)
             cli.register(*args, **options)
+        for keyword, provider in self.completers.iteritems():
+            cli.add_completer(keyword, provider)
 
         if self._on_load:
             self._on_load(cli)
 
 
+class ScriptResult(object):
+    """Outcome of :meth:`Cli.run_script`.
+
+    :param lines: number of command lines executed
+    :param errors: list of :class:`ScriptError` for the lines that failed
+    :param elapsed: wall clock seconds taken
+    :param outputs: output of each line executed, in order, if captured
+    """
+    def __init__(self, lines, errors, elapsed, outputs=None):
+        self.lines = lines
+        self.errors = errors
+        self.elapsed = elapsed
+        self.outputs = outputs
+
+    @property
+    def lines_per_second(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
+
+    def __repr__(self):
+        return '<ScriptResult %d lines, %d errors, %.0f lines/s>' % (
+            self.lines, len(self.errors), self.lines_per_second)
+
+
+#: A failed line of a script
+ScriptError = collections.namedtuple('ScriptError', 'lineno line error')
+
+
+def script_lines(script):
+    """Generate the ``(lineno, line)`` of the command lines of a script,
+    skipping blank lines and lines starting with ``!`` or ``#``"""
+    for lineno, line in enumerate(script, 1):
+        line = line.strip()
+        if line and line[0] not in '!#':
+            yield lineno, line
+
+
+# Default of :meth:`Cli.add_mode`, None names the base mode
+_NO_PARENT = object()
+
+
+class Mode(object):
+    """A command mode, with its own prompt and command tree.
+
+    Modes created from a parent share the parent's subtrees. Both trees
+    copy a shared node before changing it, so neither sees the other's
+    later changes.
+
+    :param name: name of the mode
+    :param prompt: prompt shown in the mode
+    :param root: root of the mode's command tree
+    """
+    def __init__(self, name, prompt, root=None):
+        self.name = name
+        self.prompt = prompt
+
+        #: Owner token of the nodes this mode may modify in place
+        self.token = object()
+        self.root = root if root is not None else make_root(self.token)
+
+    def own_root(self, journal=None):
+        """Return the root, copying it first if it is shared"""
+        if self.root.owner is not self.token:
+            if journal is not None:
+                journal.append(partial(setattr, self, 'root', self.root))
+            self.root = self.root.clone(self.token)
+        return self.root
+
+    def __repr__(self):
+        return '<Mode %r>' % (self.name,)
+
+
 class Cli(object):
-    def __init__(self, prompt='>', command_sets=None):
-        self.root = make_root()
+    """
+    :param prompt: prompt of the base mode
+    :param command_sets: CommandSets to load into the base mode
+    :param cache: snapshot file to load them from, see :meth:`load_many`
+    :param lazy: build the commands' subtrees on first use, see
+                 :meth:`register`
+    :param history: journal file of the command lines entered, see
+                    :class:`iscli.history.History`
+    """
+    #: Most results of :meth:`expand` a session keeps
+    expansion_cache_size = 64
+
+    def __init__(self, prompt='>', command_sets=None, cache=None,
+                 lazy=False, history=None):
+        #: Command modes by name, the base mode is named None
+        self.modes = {None: Mode(None, prompt)}
+        self._mode_stack = [self.modes[None]]
         self.prompt = prompt
 
         self.stdout = sys.stdout
 
-        for command_set in (command_sets or []):
-            self.load(command_set)
+        # Modes commands are registered into while a load is in progress
+        self._targets = None
+
+        # Undo log of tree changes while a load is in progress
+        self._journal = None
+
+        # Bumped on every change to the tree, see :meth:`tree_changed`
+        self._generation = 0
+
+        #: :class:`iscli.stats.Statistics` while enabled, see
+        #: :meth:`enable_statistics`
+        self.statistics = None
+
+        #: Completion provider of each argument keyword, see
+        #: :meth:`add_completer`
+        self.completers = {}
+        self.completion_cache = CompletionCache()
+
+        #: :class:`iscli.pager.Pager` for handlers that yield their output,
+        #: None to write all of it. The command loop sets a terminal pager.
+        self.pager = None
+
+        #: Command functions registered with ``safe=True``, see
+        #: :meth:`run_batch`
+        self.safe_handlers = set()
+
+        #: :class:`iscli.history.History` of the command loop, if any
+        self.history = None
+        if history is not None:
+            from .history import History
+            self.history = History(history)
+
+        # Position in the tree of the last command expanded
+        self._cursor = Cursor(self.root, self._generation)
+
+        # Results of :meth:`expand` by (command, extra), valid for the
+        # cursor's tree
+        self._expansions = {}
+
+        self.load_many(command_sets or [], cache=cache, lazy=lazy)
+
+    def session(self, stdout=None):
+        """Return a new Cli sharing this one's command tree.
+
+        The session has its own prompt, output stream and completion
+        state, but no copy of the tree, so it is cheap to create. The tree
+        must not change while sessions use it, see :meth:`freeze`.
+
+        :param stdout: output stream for the session
+        """
+        session = copy.copy(self)
+        session.stdout = stdout or self.stdout
+        session._journal = None
+        session._targets = None
+        session._mode_stack = list(self._mode_stack)
+        session._cursor = Cursor(self.root, self._generation)
+        session._expansions = {}
+        session.pager = None
+        return session
+
+    @property
+    def root(self):
+        """Root of the current mode's command tree"""
+        return self._mode_stack[-1].root
+
+    @root.setter
+    def root(self, root):
+        self._mode_stack[-1].root = root
+
+    @property
+    def mode(self):
+        """The current :class:`Mode`"""
+        return self._mode_stack[-1]
+
+    def add_mode(self, name, prompt, parent=_NO_PARENT):
+        """Create a command mode.
+
+        :param name: name of the mode
+        :param prompt: prompt shown in the mode
+        :param parent: name of a mode whose commands the new mode inherits,
+                       None for the base mode. The commands are shared,
+                       not copied, and changes made to either mode later
+                       do not affect the other.
+        :returns: :class:`Mode`
+        """
+        if name in self.modes:
+            raise ValueError('Mode %r already exists' % (name,))
+        mode = Mode(name, prompt)
+        if parent is not _NO_PARENT:
+            parent = self.modes[parent]
+            mode.root = parent.root.clone(mode.token)
+            # Everything the parent has is shared from now on, so the
+            # parent must copy it before writing too
+            parent.token = object()
+        self.modes[name] = mode
+        return mode
+
+    def enter_mode(self, name):
+        """Switch to a mode, pushing it on the mode stack"""
+        mode = self.modes[name]
+        self._mode_stack.append(mode)
+        self.prompt = mode.prompt
+
+    def exit_mode(self, name=None):
+        """Leave the current mode, or every mode above ``name``.
+
+        :returns: False if already in the bottom mode
+        """
+        if len(self._mode_stack) == 1:
+            return False
+        if name is None:
+            self._mode_stack.pop()
+        else:
+            while (len(self._mode_stack) > 1 and
+                    self._mode_stack[-1].name != name):
+                self._mode_stack.pop()
+        self.prompt = self._mode_stack[-1].prompt
+        return True
+
+    def _target_modes(self, mode):
+        if mode is None:
+            return self._targets or [self.modes[None]]
+        if isinstance(mode, (list, tuple)):
+            return [self.modes[m] for m in mode]
+        return [self.modes[mode]]
 
     def out(self, *objects, **kwargs):
-        kwargs['file'] = self.stdout
+        if self.cancelled():
+            raise CommandCancelled()
+        kwargs.setdefault('file', self.stdout)
         return print(*objects, **kwargs)
 
-    def load(self, command_set):
-        """Load a CommandSet of commands into this Cli."""
-        old_root = self.root
+    def cancelled(self):
+        """True if the command running in this thread has been cancelled,
+        see :meth:`commandloop_async`. Long running handlers should check
+        it between steps."""
+        task = current_task()
+        return task is not None and task.cancelled
+
+    def load(self, command_set, mode=None, cache=None, lazy=False):
+        """Load a CommandSet of commands into this Cli.
+
+        :param command_set: CommandSet to load
+        :param mode: name of the mode to load into, or a list of names,
+                     defaults to the base mode
+        :param cache: snapshot file, see :meth:`load_many`
+        :param lazy: build subtrees on first use, see :meth:`register`
+        """
+        self.load_many([command_set], mode, cache, lazy)
+
+    def load_many(self, command_sets, mode=None, cache=None, lazy=False):
+        """Load several CommandSets into this Cli in a single pass.
+
+        If any of them fails to load, every change this call made to the
+        tree is undone before the exception is re-raised.
+
+        When loading into several modes the commands are built once and
+        the modes share the resulting subtrees. The modes get the
+        commands after every ``on_load`` callback has run.
+
+        With ``cache`` the built tree is saved to that file, and later
+        loads of the same CommandSets read it back instead of building the
+        tree again. The file is rebuilt whenever a CommandSet changes, see
+        :mod:`iscli.snapshot`.
+
+        :param command_sets: CommandSets to load
+        :param mode: name of the mode to load into, or a list of names,
+                     defaults to the base mode
+        :param cache: path of a snapshot file
+        :param lazy: build subtrees on first use, see :meth:`register`.
+                     Snapshots always hold the whole tree.
+        """
+        targets = self._target_modes(mode)
+        for target in targets:
+            if isinstance(target.root, FrozenNode):
+                raise RuntimeError('Cannot load commands, Cli is frozen')
+        outer, outer_targets = self._journal, self._targets
+        journal = []
+        self._journal = journal
+        scratch = None
+        if len(targets) > 1 or cache is not None:
+            # Build into a scratch mode, then graft it into every target
+            scratch = Mode(None, None)
+            self._targets = [scratch]
+        else:
+            self._targets = targets
         try:
-            command_set.load_into(self)
+            if cache is not None:
+                self._load_snapshot(command_sets, scratch, cache)
+            else:
+                for command_set in command_sets:
+                    command_set.load_into(self, lazy=lazy)
+            if scratch is not None:
+                for target in targets:
+                    self._graft(target, scratch.root, journal)
         except Exception:
-            # Try recover the tree to a good state
-            self.root = old_root
+            # Recover the tree to a good state
+            for undo in reversed(journal):
+                undo()
+            self.tree_changed()
             raise
+        finally:
+            self._journal = outer
+            self._targets = outer_targets
+        if outer is not None:
+            # Nested load, let the enclosing one roll us back too
+            outer.extend(journal)
+
+    def _load_snapshot(self, command_sets, scratch, path):
+        from . import snapshot
+        key = snapshot.command_key(command_sets)
+        fns = snapshot.handlers(command_sets)
+        root = snapshot.load(path, key, fns, scratch.token)
+        if root is not None:
+            scratch.root = root
+        for command_set in command_sets:
+            command_set.load_into(self, prebuilt=root is not None)
+        if root is None:
+            try:
+                snapshot.dump(scratch.root, path, key, fns)
+            except (IOError, OSError):
+                # Only slower next time
+                pass
 
-    def register(self, fn, cmdspec, desc, **options):
+    def register(self, fn, cmdspec, desc, mode=None, lazy=False, safe=False,
+                 **options):
         """Register a command into this Cli.
 
         :param fn: function to register
         :param cmdspec: command specification
         :param desc: sequence of help text
+        :param mode: name of the mode to register into, or a list of names,
+                     defaults to the base mode or the modes being loaded
+        :param lazy: only add the first keyword now, and build the rest of
+                     the command the first time the keyword is walked into.
+                     Ignored for specs starting with an argument or a
+                     group, see :class:`iscli.node.LazyNode`.
+        :param safe: the function only reads state, so :meth:`run_batch`
+                     may run it alongside other safe commands
         """
-        root = make_root()
-        elements = cmdsplit(cmdspec, desc)
-        root.build(elements, fn)
-        root.merge(self.root)
-        self.root = root
+        targets = self._target_modes(mode)
+        for target in targets:
+            if isinstance(target.root, FrozenNode):
+                raise RuntimeError(
+                    'Cannot register %r, Cli is frozen' % cmdspec)
+
+        lazy = lazy and is_lazy_spec(cmdspec)
+        elements = None if lazy else cmdsplit(cmdspec, desc)
+        if len(targets) == 1:
+            journal, owner = self._journal, targets[0].token
+            root = targets[0].own_root(journal)
+        else:
+            journal, owner = None, None
+            root = make_root()
+        if lazy:
+            root.build_lazy(fn, cmdspec, desc, journal, owner)
+        else:
+            root.build(elements, fn, journal, owner)
+        if len(targets) > 1:
+            for target in targets:
+                self._graft(target, root, self._journal)
+        if safe:
+            self._add_safe_handler(fn)
+        self.tree_changed()
+
+    def _add_safe_handler(self, fn):
+        if fn not in self.safe_handlers:
+            self.safe_handlers.add(fn)
+            if self._journal is not None:
+                self._journal.append(partial(self.safe_handlers.discard, fn))
+
+    def _graft(self, mode, root, journal):
+        mode.own_root(journal).graft(root, mode.token, journal)
+        self.tree_changed()
+
+    def freeze(self):
+        """Make the command tree immutable and compact.
+
+        Expansion, completion and help work as before, but no more
+        commands can be registered.
+        """
+        memo = {}
+        for mode in self.modes.itervalues():
+            mode.root = freeze(mode.root, memo)
+        self.tree_changed()
 
-    def expand(self, command, extra=False):
+    def tree_changed(self):
+        """Drop state derived from the command tree.
+
+        Called whenever the tree is modified. Call it after changing
+        :attr:`root` or its nodes directly.
+        """
+        self._generation += 1
+
+    def expand(self, command, extra=False, parse=None):
         """Expand a command into a dictionary of possible matches.
 
         :param command: command to expand
         :param extra: include next possible argument, useful for completion
         :type extra: bool
-        :returns: dictionary where keys are expanded commands and the values
-                  are :class:`tuple`s of :class:`CliNode`s.
-        """
-        exp_command = []
-        node = self.root
-        path = []
-        for fragment in command:
-            nodes = node.match(fragment)
-            matches = len(nodes)
-            if matches == 1:
-                exp_fragment, node = nodes.popitem()
-                path.append(node)
-                exp_command.append(exp_fragment)
-            elif matches > 1:
-                # Ambiguous
-                return {
-                    tuple(exp_command + [k]): tuple(path + [n])
-                    for k, n in nodes.iteritems()
-                }
-            else:
-                # No matches
-                return {}
-
-        if extra:
-            # Asked for next fragment
-            commands = {
-                tuple(exp_command + [k]): tuple(path + [n])
-                for k, n in node.match('').iteritems()
-            }
-            if node.fn:
-                commands[tuple(exp_command)] = tuple(path)
+        :param parse: hook to call converters through when the command is
+                      not in the cache, see :meth:`iscli.node.BaseNode.match`
+        :returns: :class:`iscli.cursor.Expansion`, a mapping where keys are
+                  expanded commands and the values are :class:`tuple`s of
+                  :class:`CliNode`s. It is kept for later calls with the
+                  same command.
+        """
+        cursor = self._cursor
+        expansions = self._expansions
+        if (cursor.root is not self.root or
+                cursor.generation != self._generation):
+            cursor = self._cursor = Cursor(self.root, self._generation)
+            expansions.clear()
+
+        # Help or completion usually expanded the line before it is run
+        command = tuple(command)
+        commands = expansions.get((command, extra))
+        if commands is not None:
+            return commands
+        if len(expansions) >= self.expansion_cache_size:
+            expansions.clear()
+
+        (node, exp_command, path), nodes = cursor.seek(command, parse)
+        if nodes is not None:
+            # Ambiguous, or no matches
+            commands = Expansion(exp_command, path, nodes)
+            expansions[command, False] = expansions[command, True] = commands
             return commands
 
-        if exp_command:
-            # Found an exact match
-            return {tuple(exp_command): tuple(path)}
+        # The exact match comes with the walk either way
+        exact = expansions[command, False] = Expansion(
+            exp_command, path, None, bool(exp_command))
+        if not extra:
+            return exact
+
+        # Asked for next fragment
+        commands = expansions[command, True] = Expansion(
+            exp_command, path, node.match('', parse), bool(node.fn))
+        return commands
 
-        return {}
+    def add_completer(self, keyword, provider):
+        """Complete the arguments with a keyword, such as ``IFNAME``, with
+        the values a provider lists.
+
+        Results are kept in :attr:`completion_cache` and refreshed in the
+        background once they expire, so a slow provider does not hold up
+        completion. Sessions share providers and results.
+
+        :param keyword: keyword of the argument elements to complete
+        :param provider: function taking the Cli and returning an iterable
+                         of strings
+        """
+        self.completers[keyword] = provider
 
     def complete(self, line, text):
         """Complete command
@@ -134,20 +537,47 @@ class Cli(object):
         :param text: word to complete
         :returns: list of possibile words
         """
-        command = self.parse(line)
-        if command:
-            extra = not text.strip()
+        tokens = tokenize(line)
+        if tokens:
+            command = tuple(token.text for token in tokens)
+            extra = tokens[-1].end < len(line)
+            words = pipes.filter_words(tokens)
+            if words is not None:
+                return pipes.complete(words, extra)
             i = len(command) - int(not extra)
-            return sorted(set(
-                n[i].keyword
-                for n in self.expand(command, extra=extra).itervalues()
-                if len(n) > i and n[i].element.converter is None
-            ))
+            words = set(
+                n.keyword
+                for n in self.expand(command, extra=extra).nodes_at(i)
+                if n.element.converter is None
+            )
+            if self.completers:
+                # A partial value need not convert yet, so look for
+                # arguments after the words before it
+                prefix = '' if extra else command[-1]
+                for n in self.expand(command[:i], extra=True).nodes_at(i):
+                    if n.element.converter is None:
+                        continue
+                    keyword = n.keyword
+                    if keyword in self.completers:
+                        words.update(
+                            value for value in self.provided(keyword)
+                            if value.startswith(prefix)
+                        )
+            return sorted(words)
         return []
 
+    def provided(self, keyword):
+        """Return the values of the completion provider for a keyword, from
+        the cache"""
+        return self.completion_cache.get(
+            keyword, self.completers[keyword], self)
+
     def parse(self, line):
-        """Parse a command line into a tuple of arguments."""
-        return tuple(shlex.split(line.strip()))
+        """Parse a command line into a tuple of arguments.
+
+        :raises ValueError: on an unterminated quote
+        """
+        return split(line)
 
     def emptyline(self):
         """Called when an empty line is entered"""
@@ -159,6 +589,9 @@ class Cli(object):
     def error_ambiguous(self, line):
         self.out('%% Ambiguous command: "%s"\n' % line)
 
+    def error_invalid_pipe(self, line):
+        self.out('% Invalid output filter\n')
+
     def describe(self, line):
         """Show contextual help
 
@@ -170,85 +603,354 @@ class Cli(object):
               bar   Pour a drink
               broom Sweep the floor
         """
-        extra = (line == '' or line[-1] == ' ')
-        command = self.parse(line)
-        commands = self.expand(command, extra=extra)
+        tokens = tokenize(line)
+        extra = not tokens or tokens[-1].end < len(line)
+        words = pipes.filter_words(tokens)
+        if words is not None:
+            rows = pipes.help_rows(words, extra)
+            if not rows:
+                self.out(line)
+                self.error_invalid_pipe(line)
+                return
+            self._help_table(rows)
+            return
+
+        command = tuple(token.text for token in tokens)
+        if extra:
+            # The words that can follow the node the line leads to, from
+            # the help table the node keeps
+            commands = self.expand(command)
+            if len(commands) > 1:
+                self.error_ambiguous(line)
+                return
+            elif commands:
+                _, node = next(commands.iterlast())
+            elif not command:
+                node = self.root
+            else:
+                node = None
+
+            rows = pad = None
+            if node is not None:
+                rows, pad = node.help_table()
+                if node.fn:
+                    rows = rows + [('<cr>', '')]
+                    pad = max(pad, len('<cr>'))
+            if not rows:
+                self.out(line)
+                self.error_unrecognized(line)
+                return
+            self._help_table(rows, pad)
+            return
+
+        commands = self.expand(command)
         if not commands:
             self.out(line)
             self.error_unrecognized(line)
             return
+        self._help_table(sorted([
+            (fragment, node.element.desc)
+            for fragment, node in commands.iterlast()
+        ]))
+
+    def _help_table(self, rows, pad=None):
+        if pad is None:
+            pad = max((len(c) for c, _ in rows))
+
+        # One write for the whole table
+        self.out(''.join([
+            '    %s    %s\n' % (c.ljust(pad), desc) for c, desc in rows
+        ]))
+
+    def resolve(self, line):
+        """Find the command a line refers to.
+
+        :param line: command line, optionally followed by output filters,
+                     see :mod:`iscli.pipes`
+        :returns: tuple of the command function and its arguments
+        :raises UnrecognizedCommand: if no command matches
+        :raises AmbiguousCommand: if more than one command matches
+        :raises InvalidPipe: if an output filter is invalid
+        """
+        fn, args, _ = self._resolve(line)
+        return fn, args
+
+    def _resolve(self, line):
+        # resolve(), also returning the command function without the
+        # wrappers for output filters and statistics
+        line, pipeline = pipes.split_pipes(line)
+        if self.statistics is not None:
+            fn, args, handler = self._resolve_timed(line)
+        else:
+            fn, args, _ = self._select(line, self.expand(self.parse(line)))
+            handler = fn
+        if pipeline is not None:
+            fn = partial(pipes.run, fn, pipeline)
+        return fn, args, handler
 
-        if extra:
-            # See if we can get an exact match
-            exp_commands = self.expand(command)
-            if exp_commands:
-                command, _ = exp_commands.popitem()
-                if exp_commands:
-                    self.error_ambiguous(line)
-                    return
-
-        def row(c, node):
-            # (sort_order, keyword, description)
-            if node.fn and extra and c == command:
-                return (1, '<cr>', '')
-            return (0, c[-1], node.element.desc)
-
-        rows = [
-            r[1:]  # chop sort key
-            for r in sorted([
-                row(c, nodes[-1])
-                for c, nodes in commands.iteritems()
-            ])
+    def _select(self, line, commands):
+        matches = len(commands)
+        if not matches:
+            raise UnrecognizedCommand(line)
+        elif matches > 1:
+            raise AmbiguousCommand(line)
+
+        (command, nodes), = commands.iteritems()
+        node = nodes[-1]
+        if not node.fn:
+            raise UnrecognizedCommand(line)
+        args = [
+            a
+            for a, n in zip(command, nodes)
+            if n.element.is_argument
         ]
-        pad = max((len(c) for c, _ in rows))
+        return node.fn, args, nodes
+
+    def _resolve_timed(self, line):
+        from . import stats
+        statistics = self.statistics
+        statistics.count('lines')
 
-        for c, desc in rows:
-            self.out('    %s    %s' % (c.ljust(pad), desc))
-        self.out()
+        start = time.time()
+        command = self.parse(line)
+        parsed = time.time()
+        timer = stats.ConverterTimer()
+        commands = self.expand(command, parse=timer)
+        convert = timer.elapsed
+        expanded = time.time()
+
+        try:
+            fn, args, nodes = self._select(line, commands)
+        except UnrecognizedCommand:
+            statistics.count('unrecognized')
+            raise
+        except AmbiguousCommand:
+            statistics.count('ambiguous')
+            raise
+
+        times = {
+            'parse': parsed - start,
+            'expand': expanded - parsed - convert,
+            'convert': convert,
+        }
+        # The handler is timed wherever it ends up being called
+        return partial(statistics.call, fn, stats.command_name(nodes),
+                       times), args, fn
+
+    def enable_statistics(self):
+        """Start timing the commands this Cli and its sessions run.
+
+        :returns: :class:`iscli.stats.Statistics`, also available as
+                  :attr:`statistics` until disabled
+        """
+        if self.statistics is None:
+            from . import stats
+            self.statistics = stats.Statistics()
+        return self.statistics
+
+    def disable_statistics(self):
+        """Stop timing commands and discard the statistics"""
+        self.statistics = None
 
     def command(self, line):
         """Execute a command"""
-        commands = self.expand(self.parse(line))
-        matches = len(commands)
-        if not matches:
+        try:
+            fn, args = self.resolve(line)
+        except UnrecognizedCommand:
             self.error_unrecognized(line)
-        elif matches > 1:
+        except AmbiguousCommand:
             self.error_ambiguous(line)
+        except InvalidPipe:
+            self.error_invalid_pipe(line)
         else:
-            command, nodes = commands.popitem()
-            node = nodes[-1]
-            if node.fn:
-                args = [
-                    a
-                    for a, n in zip(command, nodes)
-                    if n.element.is_argument
-                ]
-                return node.fn(self, args)
+            return self.call(fn, args)
+
+    def call(self, fn, args):
+        """Run a command function.
+
+        If it returns a generator, the lines it yields are written with
+        :meth:`page`.
+        """
+        result = fn(self, args)
+        if isinstance(result, types.GeneratorType):
+            self.page(result)
+            return None
+        return result
+
+    def page(self, lines, file=None):
+        """Write lines through :attr:`pager` a screen at a time, stopping
+        early if the user quits. A generator is closed when done, so it is
+        not resumed for output nobody reads.
+
+        :param file: stream to write to instead of :attr:`stdout`
+        """
+        out = self.out if file is None else partial(self.out, file=file)
+        try:
+            if self.pager is None:
+                for line in lines:
+                    out(line)
             else:
-                self.error_unrecognized(line)
+                self.pager.page(lines, out)
+        finally:
+            close = getattr(lines, 'close', None)
+            if close is not None:
+                close()
+
+    def run_script(self, script, stop_on_error=True):
+        """Execute command lines without the line editor.
+
+        Blank lines and lines starting with ``!`` or ``#`` are skipped.
+        Raising :class:`ExitLoop` from a command ends the script.
+
+        :param script: path of a file, or an iterable of lines
+        :param stop_on_error: stop at the first line that fails, else carry
+                              on with the next one
+        :returns: :class:`ScriptResult`
+        """
+        if isinstance(script, basestring):
+            with open(script) as f:
+                return self.run_script(f, stop_on_error)
+
+        lines = 0
+        errors = []
+        start = time.time()
+        for lineno, line in script_lines(script):
+            lines += 1
+            try:
+                fn, args = self.resolve(line)
+                self.call(fn, args)
+            except ExitLoop:
+                break
+            except CommandError as e:
+                error = '%s: %s' % (e.__class__.__name__, line)
+            except Exception as e:
+                error = '%s: %s' % (e.__class__.__name__, e)
+            else:
+                continue
+
+            errors.append(ScriptError(lineno, line, error))
+            if stop_on_error:
+                break
+
+        return ScriptResult(lines, errors, time.time() - start)
+
+    def run_batch(self, script, workers=4, processes=False,
+                  stop_on_error=True):
+        """Execute command lines like :meth:`run_script`, running
+        consecutive commands registered with ``safe=True`` concurrently.
+
+        Each command's output is captured on its own and written to
+        :attr:`stdout` in script order. Other commands are barriers, they
+        run on this Cli once the commands before them are done. See
+        :mod:`iscli.batch`.
+
+        :param script: path of a file, or an iterable of lines
+        :param workers: threads or processes to run safe commands on
+        :param processes: run safe commands in forked processes rather
+                          than threads, for handlers that hold the GIL.
+                          Whatever they change is lost with the process.
+        :param stop_on_error: stop at the first line that fails, else carry
+                              on with the next one
+        :returns: :class:`ScriptResult` with the output of each line in
+                  ``outputs``
+        """
+        from .batch import run_batch
+        return run_batch(self, script, workers, processes, stop_on_error)
+
+    # Cli whose callbacks the line editor is using
+    _line_editor_owner = None
+
+    # History the line editor was last filled from
+    _line_editor_history = None
 
     def init_line_editor(self):
+        # The binding is imported here rather than at module level, so
+        # scripts and one-shot commands never load cffi
+        from . import linenoise
         linenoise.set_describe_callback(self.describe)
         linenoise.set_completion_callback(self.complete)
+        Cli._line_editor_owner = self
+
+    def command_async(self, line, poll_interval=0.1):
+        """Execute a command on a worker thread.
+
+        Ctrl-C while the command runs cancels it and returns straight away,
+        see :mod:`iscli.task`.
+        """
+        try:
+            fn, args = self.resolve(line)
+        except UnrecognizedCommand:
+            self.error_unrecognized(line)
+            return
+        except AmbiguousCommand:
+            self.error_ambiguous(line)
+            return
+        except InvalidPipe:
+            self.error_invalid_pipe(line)
+            return
+
+        # The output is paged on the worker too, so Ctrl-C cancels it
+        task = CommandTask(self, lambda cli, args: cli.call(fn, args), args)
+        result = task.run(poll_interval)
+        if task.cancelled:
+            self.out('% Command cancelled\n')
+        return result
 
     def commandloop(self):
+        self._commandloop(self.command)
+
+    def commandloop_async(self):
+        """Like :meth:`commandloop`, but commands run on a worker thread so
+        the rest of the process keeps running, and Ctrl-C cancels the
+        running command instead of leaving the loop."""
+        self._commandloop(self.command_async)
+
+    def handle_line(self, line, execute=None):
+        """Handle a line entered at the prompt.
+
+        :param line: line buffer
+        :param execute: function to execute commands with, defaults to
+                        :meth:`command`
+        :returns: False when the loop should end
+        """
+        line = line.strip()
+        if not line:
+            self.emptyline()
+        elif line[-1] == '?':
+            self.describe(line.rstrip('?'))
+        else:
+            try:
+                (execute or self.command)(line)
+            except ExitLoop:
+                # Leave the current mode, or the loop from the bottom one
+                return self.exit_mode()
+        return True
+
+    def _commandloop(self, execute):
+        from . import linenoise
+        if self.pager is None and self.stdout is sys.stdout:
+            from .pager import terminal_pager
+            self.pager = terminal_pager()
+        history = self.history
+        if history is not None and Cli._line_editor_history is not history:
+            # Only the recent lines go to the editor, for up and down
+            linenoise.history_set_max_len(history.size)
+            for line in list(history.recent):
+                linenoise.history_add(line)
+            Cli._line_editor_history = history
         while True:
-            self.init_line_editor()
+            # The callbacks follow mode changes by themselves, they only
+            # need installing again after a nested loop of another Cli
+            if Cli._line_editor_owner is not self:
+                self.init_line_editor()
             try:
                 line = linenoise.linenoise(self.prompt).strip()
             except EOFError:
                 break
 
-            if not line:
-                self.emptyline()
-                continue
-
-            if line[-1] == '?':
-                self.describe(line.rstrip('?'))
-                continue
-
-            linenoise.history_add(line)
-            try:
-                self.command(line)
-            except ExitLoop:
+            if line and line[-1] != '?':
+                linenoise.history_add(line)
+                if history is not None:
+                    history.add(line)
+            if not self.handle_line(line, execute):
                 break
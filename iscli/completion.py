@@ -0,0 +1,86 @@
+"""
+iscli.completion
+~~~~~~~~~~~~~~~~
+
+Completion of argument values from providers.
+
+Arguments have no fixed keywords to complete, but a provider can list
+likely values, e.g. the interfaces present right now. Providers may be
+slow, so their results are kept in a :class:`CompletionCache` and
+refreshed on a background thread once they expire. Tab is answered from
+the cache straight away, from the last results if they are out of date.
+"""
+import collections
+import threading
+import time
+
+
+class _Entry(object):
+    __slots__ = ('values', 'expires', 'refresh')
+
+    def __init__(self):
+        #: Last results, None until the provider first returns
+        self.values = None
+        self.expires = 0.0
+
+        #: Thread running the provider, if any
+        self.refresh = None
+
+
+class CompletionCache(object):
+    """Results of completion providers, by key, with a time to live and a
+    least recently used limit on the number of keys.
+
+    :param ttl: seconds results are used before they are refreshed
+    :param size: most keys kept
+    :param wait: seconds to wait for a provider with no results yet. Later
+                 calls never wait, they return the results they have and
+                 leave refreshing them to a background thread.
+    """
+    def __init__(self, ttl=30.0, size=128, wait=0.05):
+        self.ttl = ttl
+        self.size = size
+        self.wait = wait
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, provider, *args):
+        """Return the cached results of ``provider(*args)``.
+
+        :param key: cache key of the provider and arguments
+        :returns: tuple of values, empty until the provider first returns
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                entry = _Entry()
+            # Most recently used last
+            self._entries[key] = entry
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+            refresh = entry.refresh
+            if refresh is None and entry.expires <= time.time():
+                refresh = entry.refresh = threading.Thread(
+                    target=self._refresh, args=(entry, provider, args))
+                refresh.daemon = True
+                refresh.start()
+
+        if entry.values is None and refresh is not None:
+            refresh.join(self.wait)
+        return entry.values or ()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _refresh(self, entry, provider, args):
+        try:
+            values = tuple(provider(*args))
+        except Exception:
+            # Keep what we had, and try again after the next ttl
+            values = entry.values
+        with self._lock:
+            entry.values = values
+            entry.expires = time.time() + self.ttl
+            entry.refresh = None
@@ -1,14 +1,174 @@
+"""
+iscli.converter
+~~~~~~~~~~~~~~~
+
+Converters match and convert the fragments given for argument elements.
+
+A converter takes a fragment and returns a ``(match, value)`` tuple. They
+are made by factories registered against a regular expression for the
+argument spec, see :func:`register_converter`. The first factory whose
+expression matches a spec makes its converter, which is then shared by
+every element with that spec.
+
+Ready-made specs:
+
+===================== ===================================== =====
+spec                  matches                               value
+===================== ===================================== =====
+``<1-10>``            decimal integer in range              int
+``<0x0-0xff>``        hexadecimal integer in range          int
+``WORD<1-8>``         word of 1 to 8 characters             str
+``A.B.C.D``           IPv4 address                          str
+``A.B.C.D/M``         IPv4 prefix                           str
+``X:X::X:X``          IPv6 address                          str
+``X:X::X:X/M``        IPv6 prefix                           str
+``H.H.H``             MAC address as ``0011.2233.4455``     str
+``XX:XX:XX:XX:XX:XX`` MAC address as ``00:11:22:33:44:55``  str
+``CISCO_IFNAME``      interface name, such as ``Gi0/1/2``   str
+other upper case      any word                              str
+===================== ===================================== =====
+
+``IFNAME`` is any word, like other upper case specs, so it matches Linux
+interface names such as ``enp0s3`` or ``br-lan``. Use ``CISCO_IFNAME`` for
+a type followed by slash separated numbers and an optional subinterface.
+
+Converters are called for every candidate fragment while expanding, so
+they check their input up front instead of relying on exceptions.
+"""
 import re
 
 
 VARIABLE_RE = re.compile(r'([A-Z]+)')
 RANGE_RE = re.compile(r'<(\d+)\-(\d+)>')
+HEX_RANGE_RE = re.compile(r'<0[xX]([0-9a-fA-F]+)\-0[xX]([0-9a-fA-F]+)>$')
+WORD_RANGE_RE = re.compile(r'[A-Z]+<(\d+)\-(\d+)>$')
+
+_DIGITS_RE = re.compile(r'[0-9]+$')
+_HEX_RE = re.compile(r'0[xX][0-9a-fA-F]+$')
+_HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+_CISCO_IFNAME_RE = re.compile(r'[A-Za-z][A-Za-z-]*\d+(?:/\d+)*(?:\.\d+)?$')
+_MAC_DOTTED_RE = re.compile(r'(?:[0-9a-fA-F]{4}\.){2}[0-9a-fA-F]{4}$')
+_MAC_COLON_RE = re.compile(r'[0-9a-fA-F]{2}(?::[0-9a-fA-F]{2}){5}$')
+
+#: ``(regexp, factory)`` tried in order to make the converter for a spec
+CONVERTERS = []
+
+# Converter of each spec made so far
+_converters = {}
+
+
+def register_converter(pattern, factory=None):
+    """Register a converter factory for the specs matching a pattern.
+
+    Factories registered later are tried first, so they can override the
+    ready-made ones. Elements created before keep their converters. May be
+    used as a decorator.
+
+    :param pattern: regular expression matched against the start of specs
+    :param factory: function taking a spec and returning its converter, or
+                    None to leave the spec to the next factory
+    """
+    if factory is None:
+        return lambda factory: register_converter(pattern, factory)
+    CONVERTERS.insert(0, (re.compile(pattern), factory))
+    _converters.clear()
+    return factory
+
+
+def create_converter(spec):
+    """Return the converter for a spec, or None if it is a keyword"""
+    try:
+        return _converters[spec]
+    except KeyError:
+        pass
+    converter = None
+    for regexp, factory in CONVERTERS:
+        if regexp.match(spec):
+            converter = factory(spec)
+            if converter is not None:
+                break
+    _converters[spec] = converter
+    return converter
+
+
+def _matcher(regexp):
+    """Converter accepting the fragments a compiled regexp matches"""
+    match = regexp.match
+
+    def check(arg):
+        if match(arg):
+            return (True, arg)
+        return (False, None)
+    return check
+
+
+def _is_digits(arg):
+    # unicode.isdigit() is also true of digits int() does not take
+    return arg.isdigit() and (type(arg) is str or bool(_DIGITS_RE.match(arg)))
+
+
+def _is_ipv4(arg):
+    parts = arg.split('.')
+    if len(parts) != 4:
+        return False
+    for part in parts:
+        if not _is_digits(part) or len(part) > 3 or int(part) > 255:
+            return False
+    return True
+
+
+def _is_ipv6(arg):
+    groups = 8
+    if '.' in arg:
+        # Embedded IPv4 address in the last 32 bits
+        arg, sep, ipv4 = arg.rpartition(':')
+        if not sep or not _is_ipv4(ipv4):
+            return False
+        if arg.endswith(':'):
+            # It followed the ::
+            arg += ':'
+        groups = 6
+
+    head, sep, tail = arg.partition('::')
+    if '::' in tail:
+        return False
+    head = head.split(':') if head else []
+    tail = tail.split(':') if tail else []
+    count = len(head) + len(tail)
+    if count > groups - 1 if sep else count != groups:
+        return False
+    for group in head + tail:
+        if not 1 <= len(group) <= 4 or not _HEX_DIGITS.issuperset(group):
+            return False
+    return True
+
+
+def _prefix(is_address, bits):
+    def check(arg):
+        address, sep, length = arg.partition('/')
+        if (sep and _is_digits(length) and len(length) <= 3 and
+                int(length) <= bits and is_address(address)):
+            return (True, arg)
+        return (False, None)
+    return check
+
+
+def _address(is_address):
+    def check(arg):
+        if is_address(arg):
+            return (True, arg)
+        return (False, None)
+    return check
+
+
+def _any(arg):
+    return (True, arg)
 
 
 def variable_converter(spec):
     m = VARIABLE_RE.match(spec)
     if m:
-        return lambda arg: (True, arg)
+        return _any
 
 
 def range_converter(spec):
@@ -17,19 +177,51 @@ def range_converter(spec):
         start, end = int(m.group(1)), int(m.group(2))
 
         def check(arg):
-            try:
+            # Inlined _is_digits, this is the most common converter
+            if arg.isdigit() and (type(arg) is str or _DIGITS_RE.match(arg)):
                 value = int(arg)
-                return (value >= start and value <= end, value)
-            except ValueError:
+                return (start <= value <= end, value)
+            return (False, None)
+        return check
+
+
+def hex_range_converter(spec):
+    m = HEX_RANGE_RE.match(spec)
+    if m:
+        start, end = int(m.group(1), 16), int(m.group(2), 16)
+        digits = len(m.group(2).lstrip('0'))
+
+        def check(arg):
+            if (not _HEX_RE.match(arg) or
+                    len(arg[2:].lstrip('0')) > digits):
                 return (False, None)
+            value = int(arg, 16)
+            return (start <= value <= end, value)
         return check
 
 
-def create_converter(spec):
-    converters = (
-        (VARIABLE_RE, variable_converter),
-        (RANGE_RE, range_converter),
-    )
-    for regexp, fn in converters:
-        if regexp.match(spec):
-            return fn(spec)
+def word_range_converter(spec):
+    m = WORD_RANGE_RE.match(spec)
+    if m:
+        start, end = int(m.group(1)), int(m.group(2))
+
+        def check(arg):
+            if start <= len(arg) <= end:
+                return (True, arg)
+            return (False, None)
+        return check
+
+
+# Least specific first, each registration goes in front of the previous
+register_converter(VARIABLE_RE.pattern, variable_converter)
+register_converter(RANGE_RE.pattern, range_converter)
+register_converter(WORD_RANGE_RE.pattern, word_range_converter)
+register_converter(HEX_RANGE_RE.pattern, hex_range_converter)
+register_converter(r'CISCO_IFNAME$',
+                   lambda spec: _matcher(_CISCO_IFNAME_RE))
+register_converter(r'H\.H\.H$', lambda spec: _matcher(_MAC_DOTTED_RE))
+register_converter(r'XX(:XX){5}$', lambda spec: _matcher(_MAC_COLON_RE))
+register_converter(r'X:X::X:X$', lambda spec: _address(_is_ipv6))
+register_converter(r'X:X::X:X/M$', lambda spec: _prefix(_is_ipv6, 128))
+register_converter(r'A\.B\.C\.D$', lambda spec: _address(_is_ipv4))
+register_converter(r'A\.B\.C\.D/M$', lambda spec: _prefix(_is_ipv4, 32))
@@ -0,0 +1,136 @@
+"""
+iscli.cursor
+~~~~~~~~~~~~
+
+Incremental walk of the command tree.
+
+Completion and help are requested on almost every keystroke, and each
+request is usually the previous line with a word added or removed. The
+:class:`Cursor` remembers the node reached after each fragment of the last
+command it walked, so the next walk starts from the longest common prefix
+instead of from the root.
+
+Walks end in an :class:`Expansion`, which keeps the commands a line may
+expand to as the walked prefix and the matches of the next fragment, so
+the prefix is not copied for every match.
+"""
+import collections
+from itertools import izip
+
+
+class Cursor(object):
+    """Position in a command tree after walking a sequence of fragments.
+
+    :param root: root of the tree to walk
+    :param generation: opaque token identifying the state of the tree, a
+                       cursor is only valid while it is unchanged
+    """
+    def __init__(self, root, generation=None):
+        self.root = root
+        self.generation = generation
+
+        #: Fragments walked so far, each matched exactly one node
+        self.fragments = []
+
+        #: ``(node, expanded command, path)`` before and after each fragment
+        self.states = [(root, (), ())]
+
+    def seek(self, command, parse=None):
+        """Walk to the end of a command, reusing the common prefix with the
+        previous walk.
+
+        The walk stops at the first fragment that does not match exactly
+        one node.
+
+        :param command: sequence of fragments
+        :param parse: hook to call converters through, see
+                      :meth:`iscli.node.BaseNode.match`
+        :returns: tuple of the last ``(node, expanded command, path)`` state
+                  reached, and the matches of the fragment the walk stopped
+                  at, or None if every fragment was walked
+        """
+        fragments, states = self.fragments, self.states
+
+        # Rewind to the common prefix
+        common = 0
+        for walked, fragment in izip(fragments, command):
+            if walked != fragment:
+                break
+            common += 1
+        del fragments[common:]
+        del states[common + 1:]
+
+        # Advance over the rest
+        node, exp_command, path = states[-1]
+        for fragment in command[common:]:
+            nodes = node.match(fragment, parse)
+            if len(nodes) != 1:
+                return states[-1], nodes
+            exp_fragment, node = nodes.popitem()
+            exp_command += (exp_fragment,)
+            path += (node,)
+            fragments.append(fragment)
+            states.append((node, exp_command, path))
+        return states[-1], None
+
+
+class Expansion(collections.Mapping):
+    """The commands a command line may expand to, see :meth:`Cli.expand`.
+
+    All of them start with the same walked prefix and differ by at most one
+    more fragment. Read as a mapping of expanded commands to tuples of
+    nodes, the tuples are built on demand. :meth:`iterlast` and
+    :meth:`nodes_at` answer what completion, help and dispatch need without
+    building them.
+
+    :param command: expanded command walked so far
+    :param path: nodes walked so far
+    :param matches: mapping of the expanded next fragment to its node
+    :param exact: True if the walked command is one of the commands
+    """
+    __slots__ = ('command', 'path', 'matches', 'exact')
+
+    def __init__(self, command=(), path=(), matches=None, exact=False):
+        self.command = command
+        self.path = path
+        self.matches = matches or {}
+        self.exact = exact
+
+    def __len__(self):
+        return len(self.matches) + self.exact
+
+    def __iter__(self):
+        command = self.command
+        if self.exact:
+            yield command
+        for fragment in self.matches:
+            yield command + (fragment,)
+
+    def __getitem__(self, key):
+        command = self.command
+        if self.exact and key == command:
+            return self.path
+        if len(key) == len(command) + 1 and key[:-1] == command:
+            node = self.matches.get(key[-1])
+            if node is not None:
+                return self.path + (node,)
+        raise KeyError(key)
+
+    def iterlast(self):
+        """Generate the last fragment and node of each command"""
+        if self.exact:
+            yield self.command[-1], self.path[-1]
+        for item in self.matches.iteritems():
+            yield item
+
+    def nodes_at(self, i):
+        """Return the nodes at position ``i`` of the commands' paths"""
+        path = self.path
+        if i < len(path):
+            return [path[i]] if self else []
+        if i == len(path):
+            return self.matches.values()
+        return []
+
+    def __repr__(self):
+        return 'Expansion(%r)' % dict(self.iteritems())
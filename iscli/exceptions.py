@@ -6,3 +6,26 @@ class CommandLoopControl(Exception):
 
 class ExitLoop(CommandLoopControl):
     pass
+
+
+class CommandError(Exception):
+    """A command line could not be resolved to a command"""
+    pass
+
+
+class UnrecognizedCommand(CommandError):
+    pass
+
+
+class AmbiguousCommand(CommandError):
+    pass
+
+
+class CommandCancelled(Exception):
+    """Raised inside a command that was cancelled while running"""
+    pass
+
+
+class InvalidPipe(CommandError):
+    """An output filter after ``|`` is unknown or its regexp is bad"""
+    pass
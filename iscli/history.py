@@ -0,0 +1,267 @@
+"""
+iscli.history
+~~~~~~~~~~~~~
+
+Command history kept in an append-only journal file.
+
+Each line run is appended to the journal as it is entered, so sessions
+sharing a file never rewrite each other's lines. Only the last
+:attr:`History.size` lines are read at startup, for the line editor.
+
+The whole journal is indexed by trigram on a background thread, for
+Ctrl-R style :meth:`History.search`. Once the journal holds more than
+twice :attr:`History.limit` lines, the same thread compacts it to the
+most recently used distinct lines. Load :data:`history_commands` for
+``show history``.
+"""
+import array
+import collections
+import contextlib
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from .cli import CommandSet
+
+
+def trigrams(text):
+    """Return the set of 3 character substrings of a string"""
+    return set(text[i:i + 3] for i in xrange(len(text) - 2))
+
+
+class Index(object):
+    """Distinct lines with when each was last used, indexed by trigram."""
+
+    #: Searches for text whose rarest trigram is in more than this share
+    #: of the distinct lines scan the history from the end instead of
+    #: sorting every candidate, matches being close together
+    dense = 1.0 / 64
+
+    def __init__(self):
+        self.lines = []
+        self.ids = {}
+
+        #: Position in :attr:`sequence` where each line was last added
+        self.last = array.array('i')
+
+        #: Id of each line added, oldest first
+        self.sequence = array.array('i')
+
+        #: Ids of the lines containing each trigram, in id order
+        self.postings = collections.defaultdict(lambda: array.array('i'))
+
+    def add(self, line):
+        id = self.ids.get(line)
+        if id is None:
+            id = self.ids[line] = len(self.lines)
+            self.lines.append(line)
+            self.last.append(0)
+            for trigram in trigrams(line):
+                self.postings[trigram].append(id)
+        self.last[id] = len(self.sequence)
+        self.sequence.append(id)
+
+    def search(self, text):
+        """Return an iterable of the distinct lines containing some text,
+        most recently used first"""
+        postings = [self.postings.get(t, ()) for t in trigrams(text)]
+        if postings:
+            rarest = min(postings, key=len)
+            if len(rarest) <= self.dense * len(self.lines):
+                lines = self.lines
+                ids = [id for id in rarest if text in lines[id]]
+                ids.sort(key=self.last.__getitem__, reverse=True)
+                return [lines[id] for id in ids]
+        return self._scan(text)
+
+    def _scan(self, text):
+        lines, last, sequence = self.lines, self.last, self.sequence
+        for position in xrange(len(sequence) - 1, -1, -1):
+            id = sequence[position]
+            # Each line only where it was last used
+            if last[id] == position and text in lines[id]:
+                yield lines[id]
+
+
+class History(object):
+    """History of the command lines entered.
+
+    :param path: journal file, None to keep the history in memory only
+    :param size: lines kept in :attr:`recent` for the line editor
+    :param limit: distinct lines kept when the journal is compacted
+    """
+    def __init__(self, path=None, size=1000, limit=1000000):
+        self.path = path
+        self.size = size
+        self.limit = limit
+
+        #: Most recent lines, oldest first
+        self.recent = collections.deque(maxlen=size)
+
+        self._lock = threading.Lock()
+        self._index = Index()
+        self._file = None
+        self._indexer = None
+
+        if path is not None:
+            try:
+                self._file = open(path, 'a')
+                self.recent.extend(_tail(path, size))
+            except (IOError, OSError):
+                # Unwritable, keep the history of this run only
+                self._file = None
+            else:
+                self._indexer = threading.Thread(target=self._build)
+                self._indexer.daemon = True
+                self._indexer.start()
+
+    def add(self, line):
+        """Add a line, unless it repeats the last one"""
+        with self._lock:
+            if self.recent and self.recent[-1] == line:
+                return
+            self.recent.append(line)
+            self._index.add(line)
+            if self._file is None:
+                return
+            try:
+                with self._locked():
+                    self._reopen()
+                    self._file.write(line + '\n')
+                    self._file.flush()
+            except (IOError, OSError):
+                pass
+
+    def search(self, text):
+        """Return an iterable of the distinct lines containing some text,
+        most recently used first. Waits for the journal to be indexed."""
+        if self._indexer is not None:
+            self._indexer.join()
+        with self._lock:
+            return self._index.search(text)
+
+    def compact(self):
+        """Rewrite the journal with the :attr:`limit` most recently used
+        distinct lines"""
+        with open(self.path) as f:
+            lines = f.read().split('\n')
+            # Lines other sessions add meanwhile are read under the lock
+            offset = f.tell()
+
+        with self._locked():
+            with open(self.path) as f:
+                f.seek(offset)
+                lines[-1] += f.read()
+            lines[-1:] = lines[-1].split('\n')
+
+            seen = set()
+            kept = collections.deque()
+            for line in reversed(lines):
+                if line and line not in seen:
+                    seen.add(line)
+                    kept.appendleft(line)
+                    if len(kept) == self.limit:
+                        break
+
+            temporary = '%s.%d.tmp' % (self.path, os.getpid())
+            with open(temporary, 'w') as f:
+                for line in kept:
+                    f.write(line + '\n')
+            os.rename(temporary, self.path)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _build(self):
+        index = Index()
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    index.add(line.rstrip('\n'))
+        except (IOError, OSError):
+            pass
+        with self._lock:
+            # Lines added while reading, some may have been read already
+            lines = self._index.lines
+            for id in self._index.sequence:
+                index.add(lines[id])
+            self._index = index
+
+        if len(index.sequence) > 2 * self.limit:
+            try:
+                self.compact()
+            except (IOError, OSError):
+                pass
+
+    def _reopen(self):
+        # Compaction by any session replaces the file
+        if os.fstat(self._file.fileno()).st_ino != \
+                os.stat(self.path).st_ino:
+            self._file.close()
+            self._file = open(self.path, 'a')
+
+    @contextlib.contextmanager
+    def _locked(self):
+        # Serializes appends with compaction across processes
+        if fcntl is None:
+            yield
+            return
+        with open(self.path + '.lock', 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            yield
+
+
+def _tail(path, count, block=65536):
+    """Return the last lines of a file without reading all of it"""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        data = ''
+        while end and data.count('\n') <= count:
+            start = max(0, end - block)
+            f.seek(start)
+            data = f.read(end - start) + data
+            end = start
+    lines = data.split('\n')
+    if end:
+        # Partial first line
+        del lines[0]
+    return [line for line in lines[-count - 1:] if line][-count:]
+
+
+history_commands = CommandSet()
+
+
+@history_commands.on_load
+def _enable_history(cli):
+    if cli.history is None:
+        cli.history = History()
+
+
+@history_commands.install(
+    'show history',
+    ['Show running system information',
+     'Command lines entered']
+)
+def _cmd_show_history(cli, args):
+    for line in list(cli.history.recent):
+        yield '  ' + line
+
+
+@history_commands.install(
+    'show history search .WORD',
+    ['Show running system information',
+     'Command lines entered',
+     'Lines containing some text, most recent first',
+     'Text to look for']
+)
+def _cmd_show_history_search(cli, args):
+    for line in cli.history.search(' '.join(args)):
+        yield '  ' + line
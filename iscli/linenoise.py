@@ -2,23 +2,10 @@
 Bindings for linenoise line editing library
 """
 import os
-import cffi
 import logging
 
+from ._linenoise import ffi, lib as _c
 
-ffi = cffi.FFI()
-
-_root = os.path.relpath(os.path.dirname(__file__))
-ffi.cdef('void free(void *ptr);')
-with open(os.path.join(_root, 'linenoise_ffi.h')) as header:
-    ffi.cdef(header.read())
-del header
-
-_c = ffi.verify(
-    '#include "linenoise.h"',
-    sources=[os.path.join(_root, 'linenoise.c')],
-    extra_compile_args=['-I%s' % _root]
-)
 
 _callbacks = {
     'complete': None,
@@ -29,7 +16,7 @@ _logger = logging.getLogger('linenoise')
 _logger.addHandler(logging.NullHandler())
 
 
-@ffi.callback('void(const char *, const char *, linenoiseCompletions *)')
+@ffi.def_extern()
 def _complete_cb(line, text, completions):
     try:
         line = ffi.string(line)
@@ -46,7 +33,7 @@ def _complete_cb(line, text, completions):
         _logger.exception('Exception raised in complete callback')
 
 
-@ffi.callback('void(const char *)')
+@ffi.def_extern()
 def _describe_cb(line):
     try:
         line = ffi.string(line)
@@ -65,7 +52,7 @@ def set_completion_callback(fn):
     """
     _logger.info('set_completion_callback: %r' % fn)
     _callbacks['complete'] = fn
-    _c.linenoiseSetCompletionCallback(_complete_cb if fn else ffi.NULL)
+    _c.linenoiseSetCompletionCallback(_c._complete_cb if fn else ffi.NULL)
 
 
 def set_describe_callback(fn):
@@ -76,7 +63,7 @@ def set_describe_callback(fn):
     """
     _logger.info('set_describe_callback: %r' % fn)
     _callbacks['describe'] = fn
-    _c.linenoiseSetDescribeCallback(_describe_cb if fn else ffi.NULL)
+    _c.linenoiseSetDescribeCallback(_c._describe_cb if fn else ffi.NULL)
 
 
 def linenoise(prompt):
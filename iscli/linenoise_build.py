@@ -0,0 +1,39 @@
+"""
+Build script for the linenoise binding.
+
+setuptools runs it through ``cffi_modules`` at install time to compile
+the ``iscli._linenoise`` extension, so importing :mod:`iscli.linenoise`
+only has to load a compiled module. To build in place while developing::
+
+    python iscli/linenoise_build.py
+"""
+import os
+import cffi
+
+
+ffibuilder = cffi.FFI()
+
+_package = os.path.dirname(os.path.abspath(__file__))
+# Sources are relative to the directory setup.py runs in, and that the
+# in-place build below compiles in
+_top = os.path.dirname(_package)
+ffibuilder.cdef('void free(void *ptr);')
+with open(os.path.join(_package, 'linenoise_ffi.h')) as header:
+    ffibuilder.cdef(header.read())
+del header
+ffibuilder.cdef('''
+extern "Python" void _complete_cb(const char *, const char *,
+                                  linenoiseCompletions *);
+extern "Python" void _describe_cb(const char *);
+''')
+
+ffibuilder.set_source(
+    'iscli._linenoise',
+    '#include <stdlib.h>\n#include "linenoise.h"',
+    sources=[os.path.join('iscli', 'linenoise.c')],
+    include_dirs=[_package],
+)
+
+
+if __name__ == '__main__':
+    ffibuilder.compile(tmpdir=_top, verbose=True)
@@ -32,24 +32,30 @@ XOR groupings are handled by creating a branch for each alternative.
         └─baz*
 
 
-OR groupings are handled by creating a branch for each permuation.
+Brace groups are sets of options that may be given in any order, each at
+most once. They could be handled by creating a branch for each
+permutation,
 
     foo {bar | baz}
 
     foo─┬─bar*──baz*
         └─baz*──bar*
 
-
-It can get complicated quickly:
+but that explodes quickly: a group of n alternatives needs a branch for
+every ordering of every subset. Instead an :class:`OptionSet` builds each
+alternative once, and the rest of the command once under a tail node:
 
     sshfs HOSTNAME ({username USERNAME | path PATH | port <1-65535>}|)
 
-    sshfs──HOSTNAME*─┬─username──USERNAME*─┬─path──PATH*──port──<1-65535>*
-                     │                     └─port──<1-65535>*──path──PATH*
-                     ├─path──PATH*─┬─username──USERNAME*──port──<1-65535>*
-                     │             └─port──<1-65535>*──username──USERNAME*
-                     └─port──<1-65535>*─┬─username──USERNAME*──path──PATH*
-                                        └─path──PATH*──username──USERNAME*
+    sshfs──HOSTNAME*──{ username──USERNAME+
+                      | path──PATH+
+                      | port──<1-65535>+ }──tail*
+
+    (+ indicates the end of an alternative)
+
+The walk carries a bitmask of the alternatives used so far. At the end of
+an alternative it may continue into any unused alternative or into the
+tail, giving the same matches as the permutations in linear memory.
 
 
 Argspec, keyword, fragment, huh?
@@ -68,7 +74,9 @@ vararg   '.FOO'   'FOO'    'blah'
 range    '<1-20>' '<1-20>' '5'
 """
 import collections
-from itertools import chain, permutations, repeat
+from bisect import bisect_left
+from functools import partial
+from itertools import chain, izip, repeat
 
 from .converter import create_converter
 
@@ -82,6 +90,11 @@ class CliElement(object):
     :param desc: description for help
     :param is_argument: consider this element an argument
     """
+    __slots__ = (
+        'argspec', 'keyword', 'desc', 'converter', 'is_argument',
+        'is_recursive',
+    )
+
     def __init__(self, argspec, desc='', is_argument=False):
 
         self.argspec = argspec
@@ -101,27 +114,28 @@ class CliElement(object):
         return self.keyword
 
 
-class CliNode(dict):
-    """The node object forms the structure of the command tree.
+class BaseNode(object):
+    """Matching behaviour shared by every kind of node in the tree.
 
-    :param element: element for this node
-    :type element: :class:`CliElement`
-    :param fn: command function
+    Subclasses provide ``element``, ``fn`` and :meth:`children`.
     """
-    def __init__(self, element, fn=None):
-        super(CliNode, self).__init__()
-        self.element = element
-        self.fn = fn
+    option_sets = ()
 
     @property
     def keyword(self):
         return self.element.keyword
 
+    def children(self):
+        """Mapping of keyword to child node"""
+        raise NotImplementedError
+
     def lookup(self, *fragments):
-        try:
-            return reduce(CliNode.get, fragments, self)
-        except AttributeError:
-            return None
+        node = self
+        for fragment in fragments:
+            node = node.children().get(fragment)
+            if node is None:
+                return None
+        return node
 
     def parse(self, fragment):
         """Expand or convert fragment
@@ -137,26 +151,233 @@ class CliNode(dict):
                 return value
         return None
 
-    def match(self, fragment):
+    def match(self, fragment, parse=None):
         """Find all matches for a fragment
 
         :param fragment: fragment to match
+        :param parse: function called as ``parse(node, fragment)`` instead
+                      of ``node.parse(fragment)``, e.g. to time converters
         :returns: dictionary of matches. The keys are
         """
+        if self.option_sets:
+            return self._match_children(fragment, parse)
+
         # First try an exact match
         node = self.get(fragment)
         if node is not None:
             return {fragment: node}
 
         # Maybe we are recursive?
-        if self.element.is_recursive and self.parse(fragment) is not None:
-            return {self.parse(fragment): self}
+        if self.element.is_recursive:
+            value = (self.parse(fragment) if parse is None
+                     else parse(self, fragment))
+            if value is not None:
+                return {value: self}
+
+        # Keywords starting with the fragment are a range of the index
+        keywords, nodes, converters = self.index()
+        matches = {}
+        i = bisect_left(keywords, fragment)
+        while i < len(keywords) and keywords[i].startswith(fragment):
+            matches[keywords[i]] = nodes[i]
+            i += 1
+
+        for node in converters:
+            value = (node.parse(fragment) if parse is None
+                     else parse(node, fragment))
+            if value is not None:
+                matches[value] = node
+        return matches
+
+    def help_table(self):
+        """Return the help for the words that can follow this node.
+
+        :returns: tuple of a list of ``(keyword, description)`` rows sorted
+                  by keyword, without ``<cr>``, and the longest keyword's
+                  length
+        """
+        rows = sorted([
+            (keyword, node.element.desc)
+            for keyword, node in self.match('').iteritems()
+        ])
+        return rows, max([len(keyword) for keyword, _ in rows] or [0])
+
+    def _match_children(self, fragment, parse=None):
+        """:meth:`match` against every node in :meth:`children`"""
+        children = self.children()
+
+        # First try an exact match
+        node = children.get(fragment)
+        if node is not None:
+            return {fragment: node}
+
+        # Maybe we are recursive?
+        if self.element.is_recursive:
+            value = (self.parse(fragment) if parse is None
+                     else parse(self, fragment))
+            if value is not None:
+                return {value: self}
 
         # Do it the long way
-        nodes = {n.parse(fragment): n for n in self.itervalues()}
+        if parse is None:
+            nodes = {n.parse(fragment): n for n in children.itervalues()}
+        else:
+            nodes = {parse(n, fragment): n for n in children.itervalues()}
         nodes.pop(None, None)  # Pop non-matches
         return nodes
 
+
+class CliNode(BaseNode, dict):
+    """The node object forms the structure of the command tree.
+
+    :param element: element for this node
+    :type element: :class:`CliElement`
+    :param fn: command function
+    :param owner: token of the tree that may modify this node in place,
+                  see :meth:`build`
+    """
+    owner = None
+
+    def __init__(self, element, fn=None, owner=None):
+        super(CliNode, self).__init__()
+        self.element = element
+        self.fn = fn
+        if owner is not None:
+            self.owner = owner
+
+    #: Keyword index of the children, built on demand by :meth:`index`
+    _index = None
+
+    #: Help table of the children, built on demand by :meth:`help_table`
+    _help = None
+
+    def __setitem__(self, keyword, node):
+        self._index = self._help = None
+        super(CliNode, self).__setitem__(keyword, node)
+
+    def __delitem__(self, keyword):
+        self._index = self._help = None
+        super(CliNode, self).__delitem__(keyword)
+
+    def pop(self, *args):
+        self._index = self._help = None
+        return super(CliNode, self).pop(*args)
+
+    def popitem(self):
+        self._index = self._help = None
+        return super(CliNode, self).popitem()
+
+    def setdefault(self, keyword, node=None):
+        self._index = self._help = None
+        return super(CliNode, self).setdefault(keyword, node)
+
+    def update(self, *args, **kwargs):
+        self._index = self._help = None
+        super(CliNode, self).update(*args, **kwargs)
+
+    def clear(self):
+        self._index = self._help = None
+        super(CliNode, self).clear()
+
+    def children(self):
+        if not self.option_sets:
+            return self
+        children = dict(self)
+        for option_set in self.option_sets:
+            option_set.add_heads(children, 0)
+        return children
+
+    def index(self):
+        """Return the keyword index of this node's children.
+
+        :returns: tuple of the sorted keywords of the children without a
+                  converter, the matching list of nodes, and a list of the
+                  children with a converter
+        """
+        if self._index is None:
+            keywords, converters = [], []
+            for keyword, node in self.iteritems():
+                if node.element.converter is None:
+                    keywords.append(keyword)
+                else:
+                    converters.append(node)
+            keywords.sort()
+            self._index = (keywords, [self[k] for k in keywords], converters)
+        return self._index
+
+    def help_table(self):
+        if self.option_sets:
+            # Alternatives are offered depending on the path walked
+            return BaseNode.help_table(self)
+        if self._help is None:
+            self._help = BaseNode.help_table(self)
+        return self._help
+
+    def add_option_set(self, option_set, journal=None):
+        """Attach an :class:`OptionSet` whose alternatives follow this node,
+        in place of one built from the same spec, so building a command
+        again does not add another"""
+        if not self.option_sets:
+            self.option_sets = []
+        for i, existing in enumerate(self.option_sets):
+            if existing is option_set or (
+                    existing.spec is not None and
+                    existing.spec == option_set.spec):
+                self.option_sets[i] = option_set
+                if journal is not None:
+                    journal.append(
+                        partial(self.option_sets.__setitem__, i, existing))
+                return
+        self.option_sets.append(option_set)
+        if journal is not None:
+            journal.append(partial(self.option_sets.remove, option_set))
+
+    def clone(self, owner):
+        """Return a shallow copy of this node, sharing its children
+
+        :param owner: owner token of the copy
+        """
+        node = self.__class__(self.element, self.fn, owner)
+        dict.update(node, self)
+        if self.option_sets:
+            node.option_sets = list(self.option_sets)
+        return node
+
+    def _own_child(self, keyword, owner, journal):
+        """Return the child for keyword, copying it first if it belongs to
+        another owner"""
+        child = self[keyword]
+        if child.owner is not owner:
+            self[keyword] = child.clone(owner)
+            if journal is not None:
+                journal.append(partial(self.__setitem__, keyword, child))
+        return self[keyword]
+
+    def graft(self, node, owner=None, journal=None):
+        """Merge the children of another node into this one.
+
+        Subtrees missing here are shared with ``node`` rather than copied,
+        so ``node`` must not be modified in place afterwards.
+
+        :param node: node to merge from
+        :param owner: owner token of this tree
+        :param journal: optional list of undo callbacks, see :meth:`build`
+        """
+        if node.fn:
+            if journal is not None:
+                journal.append(partial(setattr, self, 'fn', self.fn))
+            self.fn = node.fn
+        for option_set in node.option_sets:
+            self.add_option_set(option_set, journal)
+        for keyword, theirs in node.iteritems():
+            if keyword in self:
+                self._own_child(keyword, owner, journal).graft(
+                    theirs, owner, journal)
+            else:
+                self[keyword] = theirs
+                if journal is not None:
+                    journal.append(partial(self.pop, keyword))
+
     def merge(self, node):
         """Recursively merge a node and its children into this node"""
         assert self.keyword == node.keyword
@@ -169,40 +390,428 @@ class CliNode(dict):
             self[k].merge(node[k])
         for k in (theirs.difference(ours)):
             self[k] = node[k]
+        for option_set in node.option_sets:
+            self.add_option_set(option_set)
 
-    def build(self, elements, fn):
+    def build(self, elements, fn, journal=None, owner=None):
         """Build a command into the tree
 
+        Nodes are inserted into the existing tree in place, so the cost is
+        proportional to the size of the command rather than of the tree.
+
         :param elements: output of function:`cmdsplit`
         :param fn: function to install
+        :param journal: optional list, an undo callback is appended to it for
+                        every change made to the tree
+        :param owner: owner token of this tree. Nodes owned by someone else
+                      may be shared with other trees, so they are copied
+                      before being modified (copy-on-write). This node
+                      itself must belong to ``owner``.
         """
         node = self
         elements = collections.deque(elements)
         while elements:
             element = elements.popleft()
-            if isinstance(element, ElementGroup):
-                group = element
-                if isinstance(element, ParenGroup):
-                    branches = group
-                elif isinstance(element, BraceGroup):
-                    branches = []
-                    for i in xrange(1, len(group) + 1):
-                        for p in permutations(group, i):
-                            branches.append(chain(*p))
-                for branch in branches:
-                    node.build(chain(branch, elements), fn)
+            if isinstance(element, ParenGroup):
+                for branch in element:
+                    node.build(chain(branch, elements), fn, journal, owner)
                 return
+            elif isinstance(element, BraceGroup):
+                alternatives = [a for a in element if a]
+                if len(alternatives) < len(element):
+                    # An empty alternative makes the whole group optional
+                    node.build(elements, fn, journal, owner)
+                if alternatives:
+                    option_set = OptionSet.build(
+                        self.__class__, alternatives, elements, fn
+                    )
+                    node.add_option_set(option_set, journal)
+                return
+            elif element.keyword in node:
+                node = node._own_child(element.keyword, owner, journal)
             else:
-                node = node.setdefault(
-                    element.keyword,
-                    self.__class__(element)
-                )
+                child = self.__class__(element, owner=owner)
+                node[element.keyword] = child
+                if journal is not None:
+                    journal.append(partial(node.pop, element.keyword))
+                node = child
+        if journal is not None:
+            journal.append(partial(setattr, node, 'fn', node.fn))
         node.fn = fn
 
+    def build_lazy(self, fn, cmdspec, desc, journal=None, owner=None):
+        """Add a command whose first keyword is a child of this node, but
+        leave building the rest until it is used, see :class:`LazyNode`.
+
+        :param fn: function to install
+        :param cmdspec: command specification, see :func:`is_lazy_spec`
+        :param desc: sequence of help text
+        :param journal: optional list of undo callbacks, see :meth:`build`
+        :param owner: owner token of this tree, see :meth:`build`
+        """
+        # Fail now rather than on first use. Only the spec is kept, so
+        # memory follows the commands used.
+        elements = cmdsplit(cmdspec, desc)
+        keyword = elements[0].keyword
+        child = self.get(keyword)
+        if child is None:
+            child = LazyNode(elements[0], owner)
+            self[keyword] = child
+            if journal is not None:
+                journal.append(partial(self.pop, keyword))
+        if type(child) is not LazyNode or child.owner is not owner:
+            # Already built, or shared and so not ours to add to
+            self.build(elements, fn, journal, owner)
+            return
+        command = (fn, cmdspec, desc)
+        child.pending.append(command)
+        if journal is not None:
+            journal.append(
+                partial(child.remove_pending, child.pending, command))
+
     def __repr__(self):
+        if self.option_sets:
+            return '%s+%r' % (dict.__repr__(self), self.option_sets)
         return dict.__repr__(self)
 
 
+class LazyNode(CliNode):
+    """A node whose subtree is built the first time it is walked into.
+
+    Until then it only records the commands to build under it, so its
+    parent can list and match its keyword without paying for the subtree.
+    Any other use builds the subtree and turns the node into a plain
+    :class:`CliNode`.
+
+    :param element: element for this node
+    :param owner: owner token, see :meth:`CliNode.build`
+    """
+    def __init__(self, element, owner=None):
+        dict.__init__(self)
+        self.element = element
+        if owner is not None:
+            self.owner = owner
+
+        #: ``(fn, cmdspec, desc)`` of the commands to build under this node,
+        #: the specs start with this node's keyword
+        self.pending = []
+
+    def materialize(self):
+        """Build the subtree, returning this node as a :class:`CliNode`.
+
+        The subtree is built on a new node and only moved into this one once
+        complete, so if a command fails to build this node stays lazy.
+        """
+        node = CliNode(self.element, owner=self.owner)
+        for fn, cmdspec, desc in self.pending:
+            node.build(cmdsplit(cmdspec, desc)[1:], fn, owner=self.owner)
+        self.__class__ = CliNode
+        self.__dict__ = node.__dict__
+        dict.update(self, node)
+        return self
+
+    def remove_pending(self, pending, command):
+        """Undo :meth:`CliNode.build_lazy` adding a command.
+
+        If the subtree was built meanwhile, this node is made lazy again with
+        the other commands. Undo callbacks run in reverse, so anything added
+        to the subtree after the command has already been removed.
+
+        :param pending: :attr:`pending` when the command was added
+        :param command: the command added
+        """
+        pending.remove(command)
+        if type(self) is not LazyNode:
+            element, owner = self.element, self.owner
+            dict.clear(self)
+            self.__class__ = LazyNode
+            self.__dict__.clear()
+            self.__init__(element, owner)
+            self.pending = pending
+
+    def __getattr__(self, name):
+        # Only reached for the attributes CliNode sets on creation
+        if name == 'fn':
+            return self.materialize().fn
+        raise AttributeError(name)
+
+
+def _materializing(name):
+    def method(self, *args, **kwargs):
+        return getattr(self.materialize(), name)(*args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+for _name in (
+        'match', '_match_children', 'children', 'index', 'help_table',
+        'lookup', 'get', 'clone', 'graft', 'merge', 'build', 'add_option_set',
+        '_own_child',
+        '__getitem__', '__setitem__', '__delitem__', '__contains__',
+        '__iter__', '__len__', '__eq__', '__ne__', '__repr__', 'keys',
+        'values', 'items', 'iterkeys', 'itervalues', 'iteritems', 'has_key',
+        'pop', 'popitem', 'setdefault', 'update', 'clear', 'copy'):
+    setattr(LazyNode, _name, _materializing(_name))
+del _name
+
+
+def is_lazy_spec(cmdspec):
+    """True if the subtree under a spec's first keyword can be built later,
+    see :class:`LazyNode`. The first element must be a plain keyword."""
+    words = cmdspec.split(None, 1)
+    return bool(words) and not (
+        set(words[0]) & set('(){}|') or words[0].startswith('.') or
+        create_converter(words[0]))
+
+
+class OptionSet(object):
+    """An unordered group of alternatives, ``{a | b | c}``.
+
+    Each alternative is built once under its own junction node and the rest
+    of the command is built once under :attr:`tail`. The nodes at the end
+    of an alternative get this object as their ``fn``, marking where the
+    walk may continue with another unused alternative or leave the group.
+
+    Which alternatives have been used is not stored in the tree; it travels
+    with the walk as a bitmask inside :class:`OptionNode` views.
+
+    :param heads: junction node of each alternative
+    :param tail: junction node of the rest of the command
+    :param spec: the group and the rest of the command as a spec, telling
+                 which sets are built from the same command
+    """
+    __slots__ = ('heads', 'tail', 'spec')
+
+    def __init__(self, heads=(), tail=None, spec=None):
+        self.heads = heads
+        self.tail = tail
+        self.spec = spec
+
+    @classmethod
+    def build(cls, node_cls, alternatives, rest, fn):
+        """Build an option set
+
+        :param node_cls: class to build the alternatives with
+        :param alternatives: non-empty alternatives from :func:`cmdsplit`
+        :param rest: elements that follow the group
+        :param fn: command function
+        """
+        option_set = cls([], None, spec_text([BraceGroup(alternatives)]) +
+                         ' ' + spec_text(rest))
+        for alternative in alternatives:
+            head = node_cls(CliElement('_option'))
+            head.build(alternative, option_set)
+            option_set.heads.append(head)
+
+        option_set.tail = node_cls(CliElement('_tail'))
+        option_set.tail.build(rest, fn)
+        return option_set
+
+    def add_heads(self, children, mask):
+        """Add the first nodes of every alternative not in ``mask``
+
+        :param children: mapping of keyword to node to add to
+        :param mask: bitmask of the alternatives already used
+        """
+        for i, head in enumerate(self.heads):
+            bit = 1 << i
+            if mask & bit:
+                continue
+            for keyword, node in head.children().iteritems():
+                join(children, keyword, OptionNode(node, self, mask | bit))
+
+    def __repr__(self):
+        return '{%s}' % ' | '.join(repr(head) for head in self.heads)
+
+
+class OptionNode(BaseNode):
+    """A view of a node inside an :class:`OptionSet`, carrying the bitmask
+    of alternatives used so far. Views are created as the tree is walked
+    and are not stored in it.
+
+    :param base: node being viewed
+    :param option_set: option set the node belongs to
+    :param mask: bitmask of the alternatives used so far
+    """
+    __slots__ = ('base', 'option_set', 'mask')
+
+    def __init__(self, base, option_set, mask):
+        self.base = base
+        self.option_set = option_set
+        self.mask = mask
+
+    @property
+    def element(self):
+        return self.base.element
+
+    def match(self, fragment, parse=None):
+        return self._match_children(fragment, parse)
+
+    @property
+    def fn(self):
+        fn = self.base.fn
+        if fn is self.option_set:
+            return self.option_set.tail.fn
+        return fn
+
+    def children(self):
+        option_set, mask = self.option_set, self.mask
+        children = {
+            keyword: OptionNode(node, option_set, mask)
+            for keyword, node in self.base.children().iteritems()
+        }
+        if self.base.fn is option_set:
+            # End of an alternative, pick another one or leave the group
+            option_set.add_heads(children, mask)
+            for keyword, node in option_set.tail.children().iteritems():
+                join(children, keyword, node)
+        return children
+
+    def __repr__(self):
+        return '%r[%s]' % (self.base, bin(self.mask))
+
+
+class NodeUnion(BaseNode):
+    """Two nodes reached by the same keyword, matched as one.
+
+    :param first: node that takes precedence for ``element`` and ``fn``
+    :param second: other node
+    """
+    __slots__ = ('first', 'second')
+
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    @property
+    def element(self):
+        return self.first.element
+
+    def match(self, fragment, parse=None):
+        return self._match_children(fragment, parse)
+
+    @property
+    def fn(self):
+        return self.first.fn or self.second.fn
+
+    def children(self):
+        children = dict(self.first.children())
+        for keyword, node in self.second.children().iteritems():
+            join(children, keyword, node)
+        return children
+
+    def __repr__(self):
+        return '(%r | %r)' % (self.first, self.second)
+
+
+def join(children, keyword, node):
+    """Add ``node`` to a mapping of children, forming a :class:`NodeUnion`
+    with any node already reached by the same keyword."""
+    other = children.get(keyword)
+    children[keyword] = node if other is None else NodeUnion(other, node)
+
+
+class FrozenNode(BaseNode):
+    """Immutable, compact form of a :class:`CliNode`, see :func:`freeze`.
+
+    Children are stored in a table by keyword, next to a tuple of their
+    keywords in sorted order for prefix matching. The children that have a
+    converter are in a tuple of their own.
+    """
+    __slots__ = (
+        'element', 'fn', 'keywords', 'table', 'converters', 'option_sets',
+        '_help', '_children'
+    )
+
+    def __init__(self, element, fn, keywords, table, converters,
+                 option_sets):
+        setattr = super(FrozenNode, self).__setattr__
+        setattr('element', element)
+        setattr('fn', fn)
+        setattr('keywords', keywords)
+        setattr('table', table)
+        setattr('converters', converters)
+        setattr('option_sets', option_sets)
+        setattr('_help', None)
+        setattr('_children', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('%s is immutable' % self.__class__.__name__)
+
+    def get(self, keyword, default=None):
+        node = self.table.get(keyword)
+        if node is not None:
+            return node
+        for node in self.converters:
+            if node.keyword == keyword:
+                return node
+        return default
+
+    def match(self, fragment, parse=None):
+        # BaseNode.match, looking exact matches up in the table and
+        # bisecting only for the keywords starting with the fragment
+        if self.option_sets:
+            return self._match_children(fragment, parse)
+        table = self.table
+        node = table.get(fragment)
+        if node is not None:
+            return {fragment: node}
+        for node in self.converters:
+            if node.element.keyword == fragment:
+                return {fragment: node}
+
+        if self.element.is_recursive:
+            value = (self.parse(fragment) if parse is None
+                     else parse(self, fragment))
+            if value is not None:
+                return {value: self}
+
+        keywords = self.keywords
+        matches = {}
+        i = bisect_left(keywords, fragment)
+        while i < len(keywords) and keywords[i].startswith(fragment):
+            matches[keywords[i]] = table[keywords[i]]
+            i += 1
+        for node in self.converters:
+            value = (node.parse(fragment) if parse is None
+                     else parse(node, fragment))
+            if value is not None:
+                matches[value] = node
+        return matches
+
+    def index(self):
+        table = self.table
+        return (self.keywords, [table[k] for k in self.keywords],
+                self.converters)
+
+    def help_table(self):
+        if self.option_sets:
+            return BaseNode.help_table(self)
+        if self._help is None:
+            # Derived data, exempt from immutability
+            super(FrozenNode, self).__setattr__(
+                '_help', BaseNode.help_table(self))
+        return self._help
+
+    def children(self):
+        if not self.converters and not self.option_sets:
+            return self.table
+        # Built on demand like the help table, walks through option sets
+        # ask for it at every step
+        children = self._children
+        if children is None:
+            children = dict(self.table)
+            for node in self.converters:
+                children[node.keyword] = node
+            for option_set in self.option_sets:
+                option_set.add_heads(children, 0)
+            super(FrozenNode, self).__setattr__('_children', children)
+        return children
+
+    def __repr__(self):
+        return repr(self.children())
+
+
 class ElementGroup(list):
     def __repr__(self):
         return '%s(%s)' % (
@@ -219,6 +828,20 @@ class BraceGroup(ElementGroup):
     pass
 
 
+def spec_text(elements):
+    """Return the spec of some :func:`cmdsplit` elements, written the same
+    way whatever the spacing of the spec they were split from"""
+    words = []
+    for element in elements:
+        if isinstance(element, ElementGroup):
+            brackets = '()' if isinstance(element, ParenGroup) else '{}'
+            words.append(brackets[0] + ' | '.join(
+                spec_text(branch) for branch in element) + brackets[1])
+        else:
+            words.append(element.argspec)
+    return ' '.join(words)
+
+
 def cmdsplit(cmdspec, desc_seq=None):
     desc = iter(desc_seq) if desc_seq else repeat('')
     cmdspec = cmdspec.strip()
@@ -278,5 +901,65 @@ def cmdsplit(cmdspec, desc_seq=None):
     return elements
 
 
-def make_root():
-    return CliNode(CliElement('_root'))
+def make_root(owner=None):
+    return CliNode(CliElement('_root'), owner=owner)
+
+
+# Table of every frozen node without children
+_NO_CHILDREN = {}
+
+
+def freeze(root, memo=None):
+    """Return an immutable, compact copy of a command tree.
+
+    Nodes shared between branches stay shared, equal elements are merged
+    into a single record and keywords are interned.
+
+    :param root: root of the tree
+    :param memo: dictionary to share between calls freezing trees that
+                 have subtrees in common
+    :returns: :class:`FrozenNode`
+    """
+    if memo is None:
+        memo = {}
+    elements = memo.setdefault('elements', {})
+
+    def freeze_element(element):
+        key = (element.argspec, element.desc, element.is_argument)
+        shared = elements.get(key)
+        if shared is None:
+            shared = elements[key] = element
+            if type(element.keyword) is str:
+                element.keyword = intern(element.keyword)
+        return shared
+
+    def freeze_fn(fn):
+        if not isinstance(fn, OptionSet):
+            return fn
+        frozen = memo.get(id(fn))
+        if frozen is None:
+            frozen = memo[id(fn)] = OptionSet(spec=fn.spec)
+            frozen.heads = tuple([freeze_node(head) for head in fn.heads])
+            frozen.tail = freeze_node(fn.tail)
+        return frozen
+
+    def freeze_node(node):
+        if isinstance(node, FrozenNode):
+            return node
+        frozen = memo.get(id(node))
+        if frozen is None:
+            keywords, nodes, converters = node.index()
+            keywords = tuple([freeze_element(n.element).keyword
+                              for n in nodes])
+            frozen = memo[id(node)] = FrozenNode(
+                freeze_element(node.element),
+                freeze_fn(node.fn),
+                keywords,
+                dict(izip(keywords, [freeze_node(n) for n in nodes]))
+                if nodes else _NO_CHILDREN,
+                tuple([freeze_node(n) for n in converters]),
+                tuple([freeze_fn(o) for o in node.option_sets]),
+            )
+        return frozen
+
+    return freeze_node(root)
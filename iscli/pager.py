@@ -0,0 +1,112 @@
+"""
+iscli.pager
+~~~~~~~~~~~
+
+A ``--More--`` pager for handlers that yield their output.
+
+A handler that returns a generator of lines is paged by :meth:`Cli.page`.
+The pager pulls one screen of lines, then waits for a key before pulling
+the next, so the handler only does the work for what is shown::
+
+    @commands.install('show routes')
+    def show_routes(cli, args):
+        for route in routing_table():
+            yield '%-18s %s' % (route.prefix, route.nexthop)
+
+At ``--More--``, space shows the next screen, return the next line and
+``q`` stops the output. The generator is then closed, so its ``finally``
+blocks run and nothing more is generated.
+"""
+import os
+import struct
+import sys
+
+
+# Returned by next() once the lines run out
+_END = object()
+
+
+class Pager(object):
+    """Write lines a screen at a time, asking before each further screen.
+
+    :param height: lines per screen, the last one is used by the prompt
+    :param read_key: function returning the next key pressed, a one
+                     character string, empty at end of input
+    :param stdout: stream to write the prompt to
+    """
+    prompt = ' --More-- '
+
+    def __init__(self, height, read_key, stdout):
+        self.height = max(height, 2)
+        self.read_key = read_key
+        self.stdout = stdout
+
+    def page(self, lines, out):
+        """Write lines with ``out`` until they run out or the user quits.
+
+        :returns: False if the user quit before the end
+        """
+        lines = iter(lines)
+        remaining = self.height - 1
+        while True:
+            if not remaining:
+                key = self.more()
+                if key in ('q', 'Q', '\x03', ''):
+                    return False
+                remaining = 1 if key in '\r\n' else self.height - 1
+            # Pull the next line only once it is wanted
+            line = next(lines, _END)
+            if line is _END:
+                return True
+            out(line)
+            remaining -= 1
+
+    def more(self):
+        """Show the prompt, wait for a key and erase the prompt"""
+        self.stdout.write(self.prompt)
+        self.stdout.flush()
+        try:
+            key = self.read_key()
+        finally:
+            self.stdout.write('\r%s\r' % (' ' * len(self.prompt)))
+            self.stdout.flush()
+        return key
+
+
+def terminal_height(fd, default=24):
+    """Return the number of rows of the terminal on ``fd``"""
+    try:
+        import fcntl
+        import termios
+        rows, _ = struct.unpack(
+            'hh', fcntl.ioctl(fd, termios.TIOCGWINSZ, '\0' * 4))
+    except (ImportError, IOError):
+        rows = 0
+    if not rows:
+        rows = int(os.environ.get('LINES') or default)
+    return rows
+
+
+def read_key(stream=None):
+    """Read one key press from a terminal without waiting for return"""
+    import termios
+    import tty
+    stream = stream or sys.stdin
+    fd = stream.fileno()
+    attributes = termios.tcgetattr(fd)
+    try:
+        tty.setraw(fd)
+        return os.read(fd, 1)
+    finally:
+        termios.tcsetattr(fd, termios.TCSADRAIN, attributes)
+
+
+def terminal_pager(stdin=None, stdout=None):
+    """Return a :class:`Pager` for the terminal, or None if either stream
+    is not one"""
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    if not (stdin.isatty() and stdout.isatty()):
+        return None
+    return Pager(terminal_height(stdout.fileno()),
+                 lambda: read_key(stdin), stdout)
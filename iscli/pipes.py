@@ -0,0 +1,270 @@
+"""
+iscli.pipes
+~~~~~~~~~~~
+
+Output filters given after ``|`` at the end of a command line::
+
+    show running-config | section router bgp | include neighbor
+
+========================= ==================================================
+``| include REGEX``       lines matching REGEX
+``| exclude REGEX``       lines not matching REGEX
+``| begin REGEX``         everything from the first line matching REGEX
+``| section REGEX``       lines matching REGEX with the more indented lines
+                          that follow them
+``| count [REGEX]``       the number of lines, or of lines matching REGEX
+========================= ==================================================
+
+Filter names may be abbreviated. The words of a regular expression are
+joined with single spaces, quote it to keep other spacing or to match a
+lone ``|``. Regular expressions are compiled once when the line is parsed.
+
+Each filter sees one line at a time, so output of any length is filtered
+in constant memory. The handler's output reaches the filters whether it
+is written with :meth:`Cli.out` or yielded. Yielded lines are pulled
+through the filters by the pager, so quitting the pager stops the handler.
+"""
+from __future__ import print_function
+
+import re
+import types
+
+from .exceptions import InvalidPipe
+from .task import current_task
+from .tokenizer import tokenize
+
+
+class Include(object):
+    def __init__(self, regexp):
+        self.search = regexp.search
+
+    def feed(self, line):
+        return (line,) if self.search(line) else ()
+
+    def finish(self):
+        return ()
+
+
+class Exclude(Include):
+    def feed(self, line):
+        return () if self.search(line) else (line,)
+
+
+class Begin(Include):
+    def feed(self, line):
+        if self.search is None or self.search(line):
+            # Found, the rest passes without matching
+            self.search = None
+            return (line,)
+        return ()
+
+
+class Section(Include):
+    # Indentation of the line that started the current section
+    indent = None
+
+    def feed(self, line):
+        indent = len(line) - len(line.lstrip())
+        if self.indent is not None and indent > self.indent and line.strip():
+            return (line,)
+        self.indent = None
+        if self.search(line):
+            self.indent = indent
+            return (line,)
+        return ()
+
+
+class Count(object):
+    def __init__(self, regexp=None):
+        self.search = regexp.search if regexp else None
+        self.count = 0
+
+    def feed(self, line):
+        if self.search is None or self.search(line):
+            self.count += 1
+        return ()
+
+    def finish(self):
+        if self.search is None:
+            return ('Number of lines = %d' % self.count,)
+        return ('Number of lines which match regexp = %d' % self.count,)
+
+
+#: Filter class of each name, whether its regexp is required and its help
+FILTERS = {
+    'include': (Include, True, 'Include lines that match'),
+    'exclude': (Exclude, True, 'Exclude lines that match'),
+    'begin': (Begin, True, 'Begin with the line that matches'),
+    'section': (Section, True, 'Filter a section of output'),
+    'count': (Count, False, 'Count number of lines which match'),
+}
+
+
+def _filter_names(prefix):
+    return sorted(n for n in FILTERS if n.startswith(prefix))
+
+
+class Pipeline(object):
+    """Filters applied in order to each line of output.
+
+    :param stages: filter objects, see :func:`split_pipes`
+    """
+    def __init__(self, stages):
+        self.stages = stages
+        self.finished = False
+
+    def feed(self, line, start=0):
+        """Return the lines that come out of the filters for one line"""
+        lines = (line,)
+        for stage in self.stages[start:]:
+            lines = [out for l in lines for out in stage.feed(l)]
+            if not lines:
+                break
+        return lines
+
+    def finish(self):
+        """Return the lines the filters hold back until the end, once"""
+        if self.finished:
+            return []
+        self.finished = True
+        lines = []
+        for i, stage in enumerate(self.stages):
+            for line in stage.finish():
+                lines.extend(self.feed(line, i + 1))
+        return lines
+
+    def filter(self, lines):
+        """Generate the filtered lines of an iterable"""
+        try:
+            for line in lines:
+                for out in self.feed(line):
+                    yield out
+            for out in self.finish():
+                yield out
+        finally:
+            close = getattr(lines, 'close', None)
+            if close is not None:
+                close()
+
+
+class PipeWriter(object):
+    """File-like object feeding complete lines written to it through a
+    :class:`Pipeline`, see :meth:`Cli.out`. Writes are dropped once the
+    command it was created for is cancelled, see :mod:`iscli.task`.
+
+    :param pipeline: pipeline to feed
+    :param stdout: stream for the filtered lines
+    """
+    def __init__(self, pipeline, stdout):
+        self.pipeline = pipeline
+        self.stdout = stdout
+        self.task = current_task()
+        self._partial = ''
+
+    def cancelled(self):
+        return self.task is not None and self.task.cancelled
+
+    def write(self, data):
+        if self.cancelled():
+            return
+        lines = (self._partial + data).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            for out in self.pipeline.feed(line):
+                self.stdout.write(out + '\n')
+
+    def flush(self):
+        self.stdout.flush()
+
+    def close(self):
+        """Flush an unterminated last line and what the filters hold"""
+        if self.cancelled():
+            return
+        if self._partial:
+            self.write('\n')
+        for out in self.pipeline.finish():
+            self.stdout.write(out + '\n')
+
+
+def split_pipes(line):
+    """Split the filters off a command line.
+
+    :returns: the command line without them, and a :class:`Pipeline` or
+              None if there are none
+    :raises InvalidPipe: for an unknown filter or bad regexp
+    """
+    if '|' not in line:
+        return line, None
+    tokens = tokenize(line)
+    bars = [i for i, token in enumerate(tokens)
+            if token.text == '|' and not token.quoted]
+    if not bars:
+        return line, None
+
+    stages = []
+    for start, end in zip(bars, bars[1:] + [len(tokens)]):
+        words = [token.text for token in tokens[start + 1:end]]
+        if not words:
+            raise InvalidPipe(line)
+        names = _filter_names(words[0])
+        if len(names) != 1:
+            raise InvalidPipe(line)
+        cls, required, _ = FILTERS[names[0]]
+        pattern = ' '.join(words[1:])
+        if required and not pattern:
+            raise InvalidPipe(line)
+        try:
+            stages.append(cls(re.compile(pattern)) if pattern else cls())
+        except re.error:
+            raise InvalidPipe(line)
+    return line[:tokens[bars[0]].start].rstrip(), Pipeline(stages)
+
+
+def filter_words(tokens):
+    """Return the words after the last ``|`` of a tokenized line, or None
+    if there is none"""
+    for i in xrange(len(tokens) - 1, -1, -1):
+        if tokens[i].text == '|' and not tokens[i].quoted:
+            return [token.text for token in tokens[i + 1:]]
+    return None
+
+
+def complete(words, extra):
+    """Return the filter names completing the words after ``|``"""
+    if len(words) == int(not extra):
+        return _filter_names(words[0] if words else '')
+    return []
+
+
+def help_rows(words, extra):
+    """Return (keyword, description) rows of help for the words after
+    ``|``, empty if they are invalid"""
+    if not words or len(words) == int(not extra):
+        return [(n, FILTERS[n][2])
+                for n in _filter_names(words[0] if words else '')]
+    names = _filter_names(words[0])
+    if len(names) != 1:
+        return []
+    rows = [('LINE', 'Regular Expression')]
+    if len(words) > 1 or not FILTERS[names[0]][1]:
+        rows.append(('<cr>', ''))
+    return rows
+
+
+def run(fn, pipeline, cli, args):
+    """Run a command function with its output going through a pipeline.
+
+    The function is given a session of the Cli writing to the pipeline, see
+    :meth:`Cli.session`, so the Cli's own :attr:`stdout` is left as it is
+    for other commands, even if this one is cancelled.
+    """
+    stdout = cli.stdout
+    writer = PipeWriter(pipeline, stdout)
+    result = fn(cli.session(writer), args)
+    if isinstance(result, types.GeneratorType):
+        # Pull yielded lines through the filters. Anything written with
+        # cli.out meanwhile goes through the same filters.
+        cli.page(pipeline.filter(result), file=stdout)
+        result = None
+    writer.close()
+    return result
@@ -0,0 +1,89 @@
+"""
+iscli.run
+~~~~~~~~~
+
+``iscli-run`` executes scripts of command lines against a :class:`Cli`
+without starting the line editor::
+
+    iscli-run [--continue] [--jobs N] myapp.cli:commands config.txt
+
+The target is ``module:name`` where ``name`` is a :class:`Cli`, a
+:class:`CommandSet` or a callable returning a :class:`Cli`. Scripts are
+read from standard input when none are given.
+"""
+from __future__ import print_function
+
+import argparse
+import importlib
+import sys
+
+from .cli import Cli, CommandSet
+
+
+def load_cli(target):
+    """Import a :class:`Cli` from a ``module:name`` string"""
+    module_name, _, name = target.partition(':')
+    if not name:
+        raise ValueError('%r is not in module:name form' % target)
+    obj = importlib.import_module(module_name)
+    for attr in name.split('.'):
+        obj = getattr(obj, attr)
+
+    if isinstance(obj, CommandSet):
+        return Cli(command_sets=[obj])
+    if not isinstance(obj, Cli) and callable(obj):
+        obj = obj()
+    if not isinstance(obj, Cli):
+        raise TypeError('%r is not a Cli or CommandSet' % target)
+    return obj
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='iscli-run',
+        description='Execute command scripts without the line editor.',
+    )
+    parser.add_argument(
+        '-c', '--continue', dest='stop_on_error', action='store_false',
+        help='carry on after a line fails',
+    )
+    parser.add_argument(
+        '-q', '--quiet', action='store_true',
+        help='do not print the summary',
+    )
+    parser.add_argument(
+        '-j', '--jobs', type=int, default=1, metavar='N',
+        help='run up to N commands registered as safe at once',
+    )
+    parser.add_argument('target', help='module:name of a Cli or CommandSet')
+    parser.add_argument('scripts', nargs='*', help='script files')
+    args = parser.parse_args(argv)
+
+    cli = load_cli(args.target)
+
+    failed = False
+    for script in (args.scripts or [sys.stdin]):
+        if args.jobs > 1:
+            result = cli.run_batch(script, workers=args.jobs,
+                                   stop_on_error=args.stop_on_error)
+        else:
+            result = cli.run_script(script,
+                                    stop_on_error=args.stop_on_error)
+        name = script if isinstance(script, basestring) else '<stdin>'
+        for error in result.errors:
+            print('%s:%d: %s' % (name, error.lineno, error.error),
+                  file=sys.stderr)
+        if not args.quiet:
+            print('%s: %d lines, %d errors, %.3fs, %.0f lines/s' % (
+                name, result.lines, len(result.errors), result.elapsed,
+                result.lines_per_second), file=sys.stderr)
+        if result.errors:
+            failed = True
+            if args.stop_on_error:
+                break
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
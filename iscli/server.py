@@ -0,0 +1,98 @@
+"""
+iscli.server
+~~~~~~~~~~~~
+
+Serve many concurrent sessions of one :class:`Cli` over a socket.
+
+The command tree is frozen once and shared read-only by every session.
+Each connection gets a :meth:`Cli.session` with its own prompt and
+output stream, so a session costs a few small objects rather than a
+whole tree.
+
+The protocol is line based, so any socket client works::
+
+    socat - UNIX-CONNECT:/run/mycli.sock
+
+A line ending in ``?`` shows help, and a line ending in a tab character
+lists completions for its last word.
+"""
+import logging
+import os
+import SocketServer
+
+
+_logger = logging.getLogger('iscli.server')
+_logger.addHandler(logging.NullHandler())
+
+
+class SessionHandler(SocketServer.StreamRequestHandler):
+    """Run one session for the lifetime of a connection"""
+
+    def handle(self):
+        cli = self.server.cli.session(stdout=self.wfile)
+        _logger.info('session opened: %r', self.client_address)
+        while True:
+            self.wfile.write(cli.prompt)
+            line = self.rfile.readline()
+            if not line:
+                break
+            line = line.rstrip('\r\n')
+
+            if line.endswith('\t'):
+                line = line.rstrip('\t')
+                text = line.rsplit(' ', 1)[-1]
+                cli.out('  '.join(cli.complete(line, text)))
+                continue
+
+            try:
+                if not cli.handle_line(line):
+                    break
+            except Exception as e:
+                _logger.exception('Exception raised in session')
+                cli.out('%% Error: %s\n' % e)
+        _logger.info('session closed: %r', self.client_address)
+
+
+class CliServerMixIn(SocketServer.ThreadingMixIn):
+    """Socket server hosting sessions of a :class:`Cli`.
+
+    :param address: address to listen on
+    :param cli: Cli whose command tree the sessions share, it is frozen
+    :param handler: request handler class
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    #: Socket server class to initialise
+    server_class = None
+
+    def __init__(self, address, cli, handler=SessionHandler):
+        cli.freeze()
+        self.cli = cli
+        self.server_class.__init__(self, address, handler)
+
+
+class TCPCliServer(CliServerMixIn, SocketServer.TCPServer):
+    server_class = SocketServer.TCPServer
+
+
+class UnixCliServer(CliServerMixIn, SocketServer.UnixStreamServer):
+    server_class = SocketServer.UnixStreamServer
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def make_server(cli, address):
+    """Create a server for a :class:`Cli`.
+
+    :param cli: Cli to serve
+    :param address: path of a Unix socket, or a ``(host, port)`` tuple
+    """
+    if isinstance(address, basestring):
+        return UnixCliServer(address, cli)
+    return TCPCliServer(address, cli)
@@ -0,0 +1,184 @@
+"""
+iscli.snapshot
+~~~~~~~~~~~~~~
+
+Save a built command tree to a file and load it back, so a Cli started
+again with the same commands skips splitting the specs and building the
+tree.
+
+A snapshot is keyed by :func:`command_key`, a hash of every command's
+spec, help, options and handler name. When a CommandSet changes the key
+no longer matches and the snapshot is rebuilt. Handlers are not stored,
+each node records the position of its handler among the commands, and
+:func:`load` rebinds them to the functions of the CommandSets being
+loaded. Converters are recreated from the specs.
+
+The file holds plain tuples, lists and strings in :mod:`marshal` format,
+which loads faster than pickle and cannot run code.
+"""
+import gc
+import hashlib
+import marshal
+import os
+import tempfile
+
+from .node import CliElement, CliNode, OptionSet
+
+
+#: Bumped whenever the file layout changes
+VERSION = 2
+
+# File starts with this, the version and the key
+MAGIC = 'iscli-snapshot'
+
+
+def handlers(command_sets):
+    """List the handler of every command in the CommandSets in a stable
+    order, the order handlers are numbered by in a snapshot"""
+    fns = []
+    for command_set in command_sets:
+        for cmdspec in sorted(command_set.commands):
+            (fn, _, _), options = command_set.commands[cmdspec]
+            fns.append(fn)
+    return fns
+
+
+def command_key(command_sets):
+    """Return a hash identifying the commands of some CommandSets"""
+    digest = hashlib.sha1()
+    for command_set in command_sets:
+        digest.update('\0set')
+        for cmdspec in sorted(command_set.commands):
+            (fn, _, desc), options = command_set.commands[cmdspec]
+            digest.update(repr((
+                cmdspec, desc, sorted(options.items()),
+                getattr(fn, '__module__', None),
+                getattr(fn, '__name__', type(fn).__name__),
+            )))
+    return digest.hexdigest()
+
+
+def dump(root, path, key, fns):
+    """Write a command tree to a snapshot file.
+
+    The file is replaced atomically, so concurrent readers see either the
+    old snapshot or the new one.
+
+    :param root: root :class:`CliNode` of the tree
+    :param path: file to write
+    :param key: :func:`command_key` of the commands in the tree
+    :param fns: :func:`handlers` of the commands in the tree. Nodes whose
+                handler is not in it are saved without one.
+    """
+    handler_ids = {}
+    for i, fn in enumerate(fns):
+        handler_ids.setdefault(id(fn), i)
+    elements, element_ids = [], {}
+    nodes, node_ids = [], {}
+    option_sets, option_set_ids = [], {}
+
+    def element_id(element):
+        record = (element.argspec, element.desc, element.is_argument)
+        i = element_ids.get(record)
+        if i is None:
+            i = element_ids[record] = len(elements)
+            elements.append(record)
+        return i
+
+    def fn_id(fn):
+        # None is -1, handlers count up from 0 and option sets down from -2
+        if fn is None:
+            return -1
+        if isinstance(fn, OptionSet):
+            return -2 - option_set_id(fn)
+        return handler_ids.get(id(fn), -1)
+
+    def option_set_id(option_set):
+        i = option_set_ids.get(id(option_set))
+        if i is None:
+            i = option_set_ids[id(option_set)] = len(option_sets)
+            option_sets.append(None)
+            option_sets[i] = (
+                [node_id(head) for head in option_set.heads],
+                node_id(option_set.tail),
+                option_set.spec,
+            )
+        return i
+
+    def node_id(node):
+        i = node_ids.get(id(node))
+        if i is None:
+            i = node_ids[id(node)] = len(nodes)
+            nodes.append(None)
+            nodes[i] = (
+                element_id(node.element),
+                fn_id(node.fn),
+                [node_id(child) for child in node.itervalues()],
+                [option_set_id(o) for o in node.option_sets],
+            )
+        return i
+
+    node_id(root)
+    data = (MAGIC, VERSION, key, elements, nodes, option_sets)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix='.iscli-snapshot')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            marshal.dump(data, f, 2)
+        os.rename(tmp, path)
+    except Exception:
+        os.unlink(tmp)
+        raise
+
+
+def load(path, key, fns, owner=None):
+    """Load a command tree from a snapshot file.
+
+    :param path: file to read
+    :param key: :func:`command_key` of the commands to load
+    :param fns: :func:`handlers` of the commands to load
+    :param owner: owner token of the nodes, see :meth:`CliNode.build`
+    :returns: root :class:`CliNode`, or None if the file is missing, was
+              written by another version or for other commands
+    """
+    # Nothing created here can be garbage, and collections triggered by
+    # the allocations would otherwise take most of the time
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return _load(path, key, fns, owner)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _load(path, key, fns, owner):
+    try:
+        with open(path, 'rb') as f:
+            data = marshal.loads(f.read())
+    except (IOError, EOFError, ValueError, TypeError):
+        return None
+    if (type(data) is not tuple or len(data) != 6 or
+            data[:3] != (MAGIC, VERSION, key)):
+        return None
+    _, _, _, elements, nodes, option_sets = data
+
+    elements = [CliElement(argspec, desc, is_argument)
+                for argspec, desc, is_argument in elements]
+    built = [CliNode(elements[element], None, owner)
+             for element, _, _, _ in nodes]
+    sets = [OptionSet([built[i] for i in heads], built[tail], spec)
+            for heads, tail, spec in option_sets]
+
+    for node, (_, fn, children, node_sets) in zip(built, nodes):
+        if fn >= 0:
+            node.fn = fns[fn]
+        elif fn < -1:
+            node.fn = sets[-2 - fn]
+        if children:
+            dict.update(node, [(child.element.keyword, child)
+                               for child in [built[i] for i in children]])
+        if node_sets:
+            node.option_sets = [sets[i] for i in node_sets]
+    return built[0]
@@ -0,0 +1,297 @@
+"""
+iscli.stats
+~~~~~~~~~~~
+
+Optional timing of where the time to run a command goes.
+
+Nothing here is imported or run until :meth:`Cli.enable_statistics` is
+first called. While statistics are enabled every command line is timed in
+four phases:
+
+parse
+    splitting the line into fragments
+expand
+    walking the command tree, excluding converters
+convert
+    converter calls made while walking the tree
+handler
+    the command function
+
+Counts and latency histograms are kept for each phase and for each command
+run. Load :data:`statistics_commands` for ``show cli statistics``.
+"""
+from __future__ import print_function
+
+import collections
+import threading
+import time
+import types
+
+from .cli import CommandSet
+from .exceptions import CommandCancelled, CommandLoopControl
+
+
+#: Phases timed for every command line, in order
+PHASES = ('parse', 'expand', 'convert', 'handler')
+
+
+class ConverterTimer(object):
+    """Hook adding up the time converters take in a walk of the tree, see
+    :meth:`iscli.node.BaseNode.match`. Only the walk it is passed to is
+    timed, through each node's own :meth:`parse`.
+    """
+    __slots__ = ('elapsed',)
+
+    def __init__(self):
+        #: Seconds spent in converters so far
+        self.elapsed = 0.0
+
+    def __call__(self, node, fragment):
+        if node.element.converter is None:
+            return node.parse(fragment)
+        start = time.time()
+        try:
+            return node.parse(fragment)
+        finally:
+            self.elapsed += time.time() - start
+
+
+class Histogram(object):
+    """Latency histogram with power of two buckets.
+
+    Bucket ``i`` counts the samples under ``2 ** i`` microseconds that are
+    not in a lower bucket, the last bucket counts everything slower.
+    """
+    __slots__ = ('count', 'total', 'min', 'max', 'buckets')
+
+    #: Number of buckets, the last one starts at about 8 seconds
+    BUCKETS = 24
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * self.BUCKETS
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        i = int(seconds * 1e6).bit_length()
+        self.buckets[min(i, self.BUCKETS - 1)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """Estimate a percentile, in seconds.
+
+        :returns: upper bound of the bucket the percentile falls in, or the
+                  slowest sample if that is lower
+        """
+        if not self.count:
+            return 0.0
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(2 ** i / 1e6, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min or 0.0,
+            'max': self.max,
+            'mean': self.mean,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': list(self.buckets),
+        }
+
+
+class Statistics(object):
+    """Counters and latency histograms of the commands run by a Cli.
+
+    Sessions of a Cli share its statistics, so updates are locked. Values
+    are in seconds.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            #: :class:`Histogram` of each phase in :data:`PHASES`, and of the
+            #: ``total`` of them
+            self.phases = {phase: Histogram()
+                           for phase in PHASES + ('total',)}
+
+            #: :class:`Histogram` of the total time of each command, keyed by
+            #: the command's path through the tree, e.g. ``show ip WORD``
+            self.commands = collections.defaultdict(Histogram)
+
+            #: Number of ``lines`` resolved, and of those ``unrecognized``,
+            #: ``ambiguous``, or whose handler failed (``errors``)
+            self.counters = collections.Counter()
+        self.started = time.time()
+
+    def count(self, counter):
+        with self._lock:
+            self.counters[counter] += 1
+
+    def record(self, command, times):
+        """Record the run of a command.
+
+        :param command: path of the command through the tree
+        :param times: seconds taken by each phase in :data:`PHASES`
+        """
+        total = sum(times.itervalues())
+        with self._lock:
+            for phase, seconds in times.iteritems():
+                self.phases[phase].add(seconds)
+            self.phases['total'].add(total)
+            self.commands[command].add(total)
+
+    def call(self, fn, command, times, cli, args):
+        """Run a command handler, recording it once it returns. A generator
+        it returns is recorded once exhausted or closed, see :meth:`_lines`.
+        """
+        start = time.time()
+        lines = None
+        try:
+            lines = fn(cli, args)
+            if not isinstance(lines, types.GeneratorType):
+                return lines
+            times['handler'] = time.time() - start
+            return self._lines(lines, command, times)
+        except (CommandLoopControl, CommandCancelled):
+            raise
+        except Exception:
+            self.count('errors')
+            raise
+        finally:
+            if not isinstance(lines, types.GeneratorType):
+                times['handler'] = time.time() - start
+                self.record(command, times)
+
+    def _lines(self, lines, command, times):
+        # Yield the lines of a generator handler, adding the time taken to
+        # produce each one, but not to write it out, to the handler's
+        try:
+            while True:
+                start = time.time()
+                try:
+                    line = next(lines)
+                except StopIteration:
+                    return
+                except (CommandLoopControl, CommandCancelled):
+                    raise
+                except Exception:
+                    self.count('errors')
+                    raise
+                finally:
+                    times['handler'] += time.time() - start
+                yield line
+        finally:
+            lines.close()
+            self.record(command, times)
+
+    def as_dict(self):
+        """Return the statistics as plain data, e.g. to serialize"""
+        with self._lock:
+            return {
+                'uptime': time.time() - self.started,
+                'counters': dict(self.counters),
+                'phases': {phase: histogram.as_dict()
+                           for phase, histogram in self.phases.iteritems()},
+                'commands': {command: histogram.as_dict()
+                             for command, histogram
+                             in self.commands.iteritems()},
+            }
+
+
+def command_name(nodes):
+    """Name a command by the argspecs of its path through the tree"""
+    names = []
+    previous = None
+    for node in nodes:
+        # Varargs repeat the same node
+        if node is not previous:
+            names.append(node.element.argspec)
+        previous = node
+    return ' '.join(names)
+
+
+statistics_commands = CommandSet()
+
+
+@statistics_commands.on_load
+def _enable_statistics(cli):
+    cli.enable_statistics()
+
+
+def _us(seconds):
+    return '%.1f' % (seconds * 1e6)
+
+
+@statistics_commands.install(
+    'show cli statistics',
+    ['Show running system information',
+     'Command line interface',
+     'Time taken by each phase of running commands']
+)
+def _cmd_show_cli_statistics(cli, args):
+    stats = cli.statistics
+    if stats is None:
+        cli.out('% Statistics are disabled\n')
+        return
+
+    data = stats.as_dict()
+    counters = data['counters']
+    cli.out('Lines: %d, unrecognized: %d, ambiguous: %d, errors: %d' % (
+        counters.get('lines', 0), counters.get('unrecognized', 0),
+        counters.get('ambiguous', 0), counters.get('errors', 0)))
+    cli.out()
+
+    header = ('phase', 'count', 'mean us', 'p50 us', 'p99 us', 'max us')
+    rows = [(phase,) + _row(data['phases'][phase])
+            for phase in PHASES + ('total',)]
+    slowest = sorted(data['commands'].iteritems(),
+                     key=lambda item: -item[1]['total'])
+    rows += [('',) * len(header), ('command',) + header[1:]]
+    rows += [(command,) + _row(h) for command, h in slowest[:20]]
+
+    widths = [max(len(row[i]) for row in rows + [header])
+              for i in xrange(len(header))]
+    for row in [header] + rows:
+        cli.out('  '.join(
+            [row[0].ljust(widths[0])] +
+            [cell.rjust(width) for cell, width in zip(row[1:], widths[1:])]
+        ).rstrip())
+    cli.out()
+
+
+def _row(histogram):
+    return (str(histogram['count']), _us(histogram['mean']),
+            _us(histogram['p50']), _us(histogram['p99']),
+            _us(histogram['max']))
+
+
+@statistics_commands.install(
+    'clear cli statistics',
+    ['Reset functions',
+     'Command line interface',
+     'Time taken by each phase of running commands']
+)
+def _cmd_clear_cli_statistics(cli, args):
+    if cli.statistics is not None:
+        cli.statistics.reset()
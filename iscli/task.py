@@ -0,0 +1,85 @@
+"""
+iscli.task
+~~~~~~~~~~
+
+Run command handlers on a worker thread.
+
+While a handler waits on a slow daemon, the thread that owns the prompt
+stays free to notice Ctrl-C, and the rest of the process keeps running.
+Python threads cannot be killed, so cancellation is cooperative: the
+handler sees :meth:`Cli.cancelled` turn true, and its next call to
+:meth:`Cli.out` raises :class:`CommandCancelled`.
+"""
+import sys
+import threading
+
+from .exceptions import CommandCancelled
+
+
+#: Task of the command running in the current thread
+_current = threading.local()
+
+
+def current_task():
+    """Return the :class:`CommandTask` running in this thread, if any"""
+    return getattr(_current, 'task', None)
+
+
+class CommandTask(object):
+    """A command handler running on its own daemon thread.
+
+    :param cli: Cli the command belongs to
+    :param fn: command function
+    :param args: arguments for the command function
+    """
+    def __init__(self, cli, fn, args):
+        self.cli = cli
+        self.fn = fn
+        self.args = args
+        self.result = None
+        self.exc_info = None
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Ask the command to stop"""
+        self._cancelled.set()
+
+    def _run(self):
+        _current.task = self
+        try:
+            self.result = self.fn(self.cli, self.args)
+        except CommandCancelled:
+            pass
+        except BaseException:
+            self.exc_info = sys.exc_info()
+        finally:
+            _current.task = None
+
+    def run(self, poll_interval=0.1):
+        """Start the command and wait for it to finish.
+
+        The wait polls, so a KeyboardInterrupt reaches the calling thread
+        while the command runs. On KeyboardInterrupt the command is
+        cancelled and the wait returns without it.
+
+        :returns: the command's return value, or None if cancelled
+        :raises: any exception raised by the command
+        """
+        try:
+            self._thread.start()
+            while self._thread.is_alive():
+                self._thread.join(poll_interval)
+        except KeyboardInterrupt:
+            self.cancel()
+            return None
+
+        if self.exc_info:
+            exc_type, exc_value, tb = self.exc_info
+            raise exc_type, exc_value, tb
+        return self.result
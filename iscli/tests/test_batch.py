@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+from StringIO import StringIO
+
+from nose.tools import assert_equal, assert_less
+
+from iscli.cli import Cli, CommandSet
+from iscli.exceptions import ExitLoop
+
+
+def make_cli(log):
+    commands = CommandSet()
+
+    @commands.install('show slow WORD', safe=True)
+    def _cmd_show_slow(cli, args):
+        log.append(('start', args[0]))
+        time.sleep(0.2)
+        cli.out('slow %s' % args[0])
+        log.append(('end', args[0]))
+
+    @commands.install('show lines', safe=True)
+    def _cmd_show_lines(cli, args):
+        for i in xrange(3):
+            yield 'line %d' % i
+
+    @commands.install('show pid', safe=True)
+    def _cmd_show_pid(cli, args):
+        cli.out(os.getpid())
+
+    @commands.install('set WORD')
+    def _cmd_set(cli, args):
+        log.append(('set', args[0]))
+        cli.out('set %s' % args[0])
+
+    @commands.install('enable')
+    def _cmd_enable(cli, args):
+        cli.enter_mode('enable')
+
+    @commands.install('show secret', safe=True, mode='enable')
+    def _cmd_show_secret(cli, args):
+        cli.out('secret')
+
+    @commands.install('quit', safe=True)
+    def _cmd_quit(cli, args):
+        raise ExitLoop()
+
+    @commands.install('fail', safe=True)
+    def _cmd_fail(cli, args):
+        raise ValueError('failed')
+
+    cli = Cli()
+    cli.add_mode('enable', '#')
+    cli.load(commands)
+    cli.stdout = StringIO()
+    return cli
+
+
+def test_concurrent_in_order():
+    log = []
+    cli = make_cli(log)
+    start = time.time()
+    result = cli.run_batch(['show slow %d' % i for i in xrange(4)])
+    assert_less(time.time() - start, 0.6)
+    assert_equal(['slow %d\n' % i for i in xrange(4)], result.outputs)
+    assert_equal(''.join(result.outputs), cli.stdout.getvalue())
+    assert_equal(4, result.lines)
+    assert_equal([], result.errors)
+
+    # Yielded output and output filters are captured too
+    result = cli.run_batch(['show lines | exclude 1', 'show lines | count'])
+    assert_equal(['line 0\nline 2\n', 'Number of lines = 3\n'],
+                 result.outputs)
+
+
+def test_barriers():
+    log = []
+    cli = make_cli(log)
+    result = cli.run_batch([
+        'show slow a', 'show slow b', 'set x', 'show slow c', '! comment',
+        'enable', 'show secret',
+    ])
+    assert_equal(
+        ['slow a\n', 'slow b\n', 'set x\n', 'slow c\n', '', 'secret\n'],
+        result.outputs)
+    barrier = log.index(('set', 'x'))
+    assert_equal(set(['a', 'b']), set(n for _, n in log[:barrier]))
+    assert_equal([('start', 'c'), ('end', 'c')], log[barrier + 1:])
+    assert_equal('enable', cli.mode.name)
+
+
+def test_errors():
+    cli = make_cli([])
+    script = ['show pid', 'show bogus', 'fail', 'set y']
+    result = cli.run_batch(script)
+    assert_equal(2, result.lines)
+    assert_equal([(2, 'show bogus', 'UnrecognizedCommand: show bogus')],
+                 result.errors)
+
+    result = cli.run_batch(script, stop_on_error=False)
+    assert_equal(4, result.lines)
+    assert_equal([2, 3], [e.lineno for e in result.errors])
+    assert_equal('ValueError: failed', result.errors[1].error)
+    assert_equal('set y\n', result.outputs[-1])
+
+    # Lines that do not tokenize are errors too
+    result = cli.run_batch(['show pid', 'set "x', 'set y'],
+                           stop_on_error=False)
+    assert_equal([(2, 'set "x', 'ValueError: No closing quotation')],
+                 result.errors)
+    assert_equal(['', 'set y\n'], result.outputs[1:])
+
+    result = cli.run_batch(['set a', 'quit', 'set b'])
+    assert_equal(['set a\n'], result.outputs)
+
+
+def test_processes():
+    cli = make_cli([])
+    result = cli.run_batch(['show pid', 'set z', 'show lines | include 2'],
+                           processes=True)
+    assert_equal(['set z\n', 'line 2\n'], result.outputs[1:])
+    assert result.outputs[0] != '%d\n' % os.getpid()
@@ -1,10 +1,20 @@
 # -*- coding: utf-8 -*-
 
+import subprocess
+import sys
+import tempfile
+import thread
+import threading
+import time
 from StringIO import StringIO
 
-from nose.tools import assert_in, assert_not_in
+from nose.tools import assert_equal, assert_in, assert_not_in, assert_raises
 
+from iscli import run
 from iscli.cli import CommandSet, Cli
+from iscli.cursor import Cursor
+from iscli.exceptions import ExitLoop
+from iscli.node import CliElement, CliNode, LazyNode
 
 
 testcmd = CommandSet()
@@ -162,6 +172,16 @@ class TestCli(object):
 
         assert_in('Unrecognized', self.command('test opt bar foo'))
 
+    def test_quotes(self):
+        assert_in('test vararg', self.command('test vararg "foo bar" baz'))
+        assert_raises(ValueError, self.command, 'test vararg "foo')
+
+        # Unterminated quotes are the word being typed
+        assert_in('foo ', self.describe('test vararg "foo '))
+        assert_not_in('<cr>', self.describe('test vararg "foo '))
+        assert_equal(['system', 'version'], self.cli.complete('show "', '"'))
+        assert_equal(['version'], self.cli.complete("show 've", "'ve"))
+
     def test_vararg(self):
         assert_in('Unrecognized', self.command('test vararg'))
         assert_in('WORD', self.describe('test vararg '))
@@ -179,5 +199,504 @@ class TestCli(object):
         assert_in('<cr>', self.describe('test vararg foo foo foo 6 '))
 
 
+class TestFrozenCli(TestCli):
+    def __init__(self):
+        super(TestFrozenCli, self).__init__()
+        self.cli.freeze()
+
+    def test_frozen(self):
+        assert_raises(RuntimeError, self.cli.load, testcmd)
+        assert_raises(AttributeError, setattr, self.cli.root, 'fn', None)
+
+
+class TestLazyCli(TestCli):
+    def __init__(self):
+        self.cli = Cli()
+        self.cli.load(testcmd, lazy=True)
+
+
+def test_lazy():
+    cli = Cli(command_sets=[testcmd], lazy=True)
+    cli.stdout = StringIO()
+    assert_equal(['show', 'sshfs', 'test'],
+                 sorted(k for k, n in cli.root.iteritems()
+                        if type(n) is LazyNode))
+
+    # Listing and matching the first keyword builds nothing
+    assert_equal(['show', 'sshfs'], cli.complete('s', 's'))
+    cli.describe('')
+    assert_in(DESC_SHOW, cli.stdout.getvalue())
+    cli.expand(cli.parse('sh'))
+    assert all(type(n) is LazyNode for n in cli.root.itervalues())
+
+    cli.command('show system')
+    assert_equal('System ok\n', cli.stdout.getvalue().splitlines(True)[-1])
+    assert_equal(['sshfs', 'test'],
+                 sorted(k for k, n in cli.root.iteritems()
+                        if type(n) is LazyNode))
+
+    # Adding to a built keyword builds eagerly, to an unbuilt one lazily
+    extra = CommandSet()
+    extra.add(None, 'show clock', None)
+    extra.add(None, 'test clock', None)
+    cli.load(extra, lazy=True)
+    assert cli.root.lookup('show', 'clock') is not None
+    assert_equal(4, len(cli.root['test'].pending))
+    assert cli.root.lookup('test', 'clock') is not None
+
+    # Bad specs still fail the load
+    broken = CommandSet()
+    broken.add(None, 'sshfs (unbalanced', None)
+    assert_raises(ValueError, cli.load, broken, lazy=True)
+    assert_equal(1, len(cli.root['sshfs'].pending))
+    broken = CommandSet()
+    broken.add(None, 'sshfs mount PATH', ['Manage SSHFS', 'Mount'])
+    assert_raises(StopIteration, cli.load, broken, lazy=True)
+    assert_equal(1, len(cli.root['sshfs'].pending))
+    assert cli.root.lookup('sshfs', 'HOSTNAME') is not None
+
+    # Rolling back a load undoes building the subtree meanwhile
+    cli = Cli(command_sets=[testcmd], lazy=True)
+    cli.stdout = StringIO()
+    rolled_back = CommandSet()
+    rolled_back.add(None, 'test clock', None)
+
+    @rolled_back.on_load
+    def _use_and_fail(cli):
+        cli.command('test range 5')
+        raise RuntimeError('failed')
+
+    assert_raises(RuntimeError, cli.load, rolled_back, lazy=True)
+    assert type(cli.root['test']) is LazyNode
+    assert_equal(3, len(cli.root['test'].pending))
+    assert_equal(None, cli.root.lookup('test', 'clock'))
+    cli.command('test range 5')
+    assert_equal('test range\ntest range\n', cli.stdout.getvalue())
+
+
+def test_lazy_modes():
+    cli = Cli()
+    cli.add_mode('enable', '#')
+    cli.load(testcmd, mode=[None, 'enable'], lazy=True)
+    shared = cli.root['test']
+    assert cli.modes['enable'].root['test'] is shared
+
+    extra = CommandSet()
+    extra.add(None, 'test clock', None)
+    cli.load(extra, mode='enable', lazy=True)
+    assert type(shared) is CliNode
+    assert cli.modes['enable'].root['test'] is not shared
+    assert cli.modes['enable'].root.lookup('test', 'clock') is not None
+    assert_equal(None, cli.root.lookup('test', 'clock'))
+
+    cli.freeze()
+    assert cli.root.lookup('sshfs', 'HOSTNAME') is not None
+
+
+def test_load_rollback():
+    cli = Cli()
+    cli.load(testcmd)
+    before = repr(cli.root)
+
+    broken = CommandSet()
+    broken.add(None, 'show system detail', None)
+    broken.add(None, 'show (unbalanced', None)
+    assert_raises(ValueError, cli.load, broken)
+    assert_equal(before, repr(cli.root))
+    assert cli.root.lookup('show', 'system').fn is _cmd_show_system
+
+
+def test_load_many():
+    extra = CommandSet()
+
+    @extra.install('show system detail')
+    def _cmd_show_system_detail(cli, args):
+        pass
+
+    cli = Cli(command_sets=[testcmd, extra])
+    assert cli.root.lookup('show', 'system').fn is _cmd_show_system
+    assert (cli.root.lookup('show', 'system', 'detail').fn is
+            _cmd_show_system_detail)
+
+
+def test_brace_group():
+    options = CommandSet()
+    options.add(
+        lambda cli, args: cli.out('mount %r' % (args,)),
+        'mount HOST {ro | uid <1-100> | sync | noexec} (now|)',
+        None
+    )
+    cli = Cli(command_sets=[options])
+    cli.stdout = StringIO()
+
+    cli.command('mount h uid 5 ro')
+    cli.command('mount h noexec sync ro uid 1 now')
+    assert_equal(
+        "mount ['h', 'uid', 5, 'ro']\n"
+        "mount ['h', 'noexec', 'sync', 'ro', 'uid', 1, 'now']\n",
+        cli.stdout.getvalue()
+    )
+
+    assert_equal(['noexec', 'now', 'sync', 'uid'],
+                 cli.complete('mount h ro ', ''))
+    assert_equal(['now', 'sync'], cli.complete('mount h ro noexec uid 2 ', ''))
+    assert_equal([], cli.complete('mount h ro now ', ''))
+    assert_equal({}, cli.expand(cli.parse('mount h ro ro')))
+    assert_equal(None, cli.expand(cli.parse('mount h')).values()[0][-1].fn)
+
+    # One node per element, not one per permutation
+    option_set, = cli.root.lookup('mount', 'HOST').option_sets
+    assert_equal(4, len(option_set.heads))
+
+    # Loading the same commands again replaces the set rather than adding
+    for _ in xrange(5):
+        cli.load(options)
+    option_set, = cli.root.lookup('mount', 'HOST').option_sets
+    replaced = CommandSet()
+    replaced.add(lambda cli, args: cli.out('remount'),
+                 'mount  HOST {ro|uid <1-100>|sync|noexec}  (now|)', None)
+    cli.load(replaced)
+    assert_equal(1, len(cli.root.lookup('mount', 'HOST').option_sets))
+    cli.command('mount h sync ro')
+    assert_equal('remount\n', cli.stdout.getvalue().splitlines(True)[-1])
+
+
+def test_match_index():
+    cli = Cli()
+    cli.load(testcmd)
+    root = cli.root
+    assert_equal(['show', 'sshfs'], sorted(root.match('s')))
+    assert_equal(['show'], sorted(root.match('sh')))
+
+    # The index follows changes to the tree
+    extra = CommandSet()
+    extra.add(None, 'shutdown', None)
+    cli.load(extra)
+    assert_equal(['show', 'shutdown'], sorted(root.match('sh')))
+
+    # Converter children are matched alongside the keyword range
+    node = root.lookup('test', 'range')
+    assert_equal({7: node['<1-10>']}, node.match('7'))
+    assert_equal({}, node.match('11'))
+
+    # The index and help table follow every dict method changing children
+    def make(keyword):
+        return CliNode(CliElement(keyword))
+    root.setdefault('shell', make('shell'))
+    root.update({'sync': make('sync')})
+    assert_equal(['shell', 'show', 'shutdown', 'sshfs', 'sync'],
+                 sorted(root.match('s')))
+    assert_equal(['shell', 'show', 'shutdown', 'sshfs', 'sync'],
+                 [k for k, _ in root.help_table()[0] if k[0] == 's'])
+    root.clear()
+    assert_equal({}, root.match('s'))
+    root['show'] = make('show')
+    root.popitem()
+    assert_equal({}, root.match('s'))
+
+
+def test_help_table():
+    cli = Cli()
+    cli.load(testcmd)
+    node = cli.root.lookup('test', 'range')
+    rows, pad = node.help_table()
+    assert_equal([('<1-10>', node['<1-10>'].element.desc)], rows)
+    assert_equal(6, pad)
+    assert node.help_table() is node.help_table()
+
+    # Changing the children rebuilds it, other nodes keep theirs
+    root = cli.root.help_table()
+    extra = CommandSet()
+    extra.add(None, 'test range long-keyword', ['', '', 'Long'])
+    cli.load(extra)
+    assert cli.root.help_table() is root
+    rows, pad = cli.root.lookup('test', 'range').help_table()
+    assert_equal(['<1-10>', 'long-keyword'], [k for k, _ in rows])
+    assert_equal(12, pad)
+
+    cli.freeze()
+    frozen = cli.root.lookup('test', 'range')
+    assert_equal((rows, pad), frozen.help_table())
+    assert frozen.help_table() is frozen.help_table()
+
+
+def test_cursor():
+    cli = Cli()
+    cli.load(testcmd)
+    cursor = Cursor(cli.root)
+
+    state, nodes = cursor.seek(('sshfs', 'h', 'username', 'u'))
+    assert_equal(None, nodes)
+    assert_equal(('sshfs', 'h', 'username', 'u'), state[1])
+    states = list(cursor.states)
+
+    # Typing more only walks the new fragments
+    state, nodes = cursor.seek(('sshfs', 'h', 'username', 'u', 'po'))
+    assert_equal(None, nodes)
+    assert_equal(states, cursor.states[:5])
+    assert_equal('port', state[1][-1])
+
+    # Deleting rewinds to the common prefix
+    state, nodes = cursor.seek(('sshfs', 'h', 'x'))
+    assert_equal({}, nodes)
+    assert_equal(states[:3], cursor.states)
+
+    state, nodes = cursor.seek(('s',))
+    assert_equal(['show', 'sshfs'], sorted(nodes))
+    assert_equal([(cli.root, (), ())], cursor.states)
+
+
+def test_cursor_invalidated():
+    cli = Cli()
+    cli.load(testcmd)
+    assert_equal(['system', 'version'], cli.complete('show ', ''))
+
+    extra = CommandSet()
+    extra.add(None, 'show clock', None)
+    cli.load(extra)
+    assert_equal(['clock', 'system', 'version'], cli.complete('show ', ''))
+
+
+def test_expansion_cache():
+    cli = Cli()
+    cli.load(testcmd)
+    cli.stdout = StringIO()
+    command = ('sh', 'sys')
+    commands = cli.expand(command)
+    assert cli.expand(command) is commands
+
+    # Running the command leaves the shared result intact
+    cli.describe('sh sys ')
+    for _ in xrange(2):
+        cli.command('sh sys')
+    assert_equal({('show', 'system'): commands.values()[0]}, commands)
+    assert_equal('System ok\n', cli.stdout.getvalue().splitlines(True)[-1])
+
+    # The walk done for completion gives the exact match too
+    cli.complete('test opt ', '')
+    assert_equal([('test', 'opt')], cli.expand(('test', 'opt')).keys())
+
+    # Tree changes and other sessions start afresh
+    session = cli.session()
+    assert session.expand(command) is not commands
+    extra = CommandSet()
+    extra.add(None, 'show syslog', None)
+    cli.load(extra)
+    assert_equal(2, len(cli.expand(command)))
+
+
+def test_expansion():
+    cli = Cli()
+    cli.load(testcmd)
+    commands = cli.expand(('test',), extra=True)
+    assert_equal(set([('test', 'range'), ('test', 'opt'),
+                      ('test', 'vararg')]), set(commands))
+    path = commands[('test', 'vararg')]
+    assert_equal(['test', 'vararg'], [n.keyword for n in path])
+    # Candidates share the walked prefix
+    assert commands[('test', 'opt')][0] is path[0]
+    assert_equal([path[0]], commands.nodes_at(0))
+    assert_equal(3, len(commands.nodes_at(1)))
+    assert_equal([], commands.nodes_at(2))
+    assert_raises(KeyError, commands.__getitem__, ('test',))
+    assert_equal([], cli.expand(('bogus',)).nodes_at(0))
+
+    # Recursive fragments are parsed once
+    node = cli.expand(('test', 'vararg', 'a'))[('test', 'vararg', 'a')][-1]
+    calls = []
+    parse = node.parse
+    node.parse = lambda fragment: calls.append(fragment) or parse(fragment)
+    node.match('b')
+    assert_equal(['b'], calls)
+
+
+def test_run_script():
+    cli = Cli()
+    cli.load(testcmd)
+    cli.stdout = StringIO()
+    script = [
+        '! comment\n',
+        'show system\n',
+        '\n',
+        'show bogus\n',
+        's\n',
+        'test range 5\n',
+    ]
+
+    result = cli.run_script(script)
+    assert_equal(2, result.lines)
+    assert_equal([4], [e.lineno for e in result.errors])
+    assert_in('UnrecognizedCommand', result.errors[0].error)
+
+    result = cli.run_script(script, stop_on_error=False)
+    assert_equal(4, result.lines)
+    assert_equal([4, 5], [e.lineno for e in result.errors])
+    assert_in('AmbiguousCommand', result.errors[1].error)
+    assert_equal(2, cli.stdout.getvalue().count('System ok'))
+    assert_in('test range', cli.stdout.getvalue())
+
+
+def test_iscli_run():
+    script = tempfile.NamedTemporaryFile(suffix='.txt')
+    script.write('show version\nshow system\n')
+    script.flush()
+    assert_equal(0, run.main(
+        ['-q', 'iscli.tests.test_cli:testcmd', script.name]))
+
+    script.write('bogus\n')
+    script.flush()
+    assert_equal(1, run.main(
+        ['-q', 'iscli.tests.test_cli:testcmd', script.name]))
+    assert_equal(1, run.main(
+        ['-q', '-j', '4', 'iscli.tests.test_cli:testcmd', script.name]))
+
+
+def test_line_editor_not_loaded():
+    code = '\n'.join([
+        'import sys',
+        'from iscli.tests.test_cli import testcmd, Cli',
+        'Cli(command_sets=[testcmd]).run_script(["show version"])',
+        'assert "iscli.linenoise" not in sys.modules',
+        'assert "cffi" not in sys.modules',
+    ])
+    process = subprocess.Popen([sys.executable, '-c', code],
+                               stdout=subprocess.PIPE)
+    assert_equal('Version 1.0\n', process.communicate()[0])
+    assert_equal(0, process.returncode)
+
+
+def test_command_async():
+    slow = CommandSet()
+    started = threading.Event()
+
+    @slow.install('slow')
+    def _cmd_slow(cli, args):
+        started.set()
+        while not cli.cancelled():
+            time.sleep(0.01)
+        cli.out('not reached')
+
+    @slow.install('fast')
+    def _cmd_fast(cli, args):
+        cli.out('fast')
+        return 'result'
+
+    @slow.install('exit')
+    def _cmd_exit(cli, args):
+        raise ExitLoop()
+
+    cli = Cli(command_sets=[slow])
+    cli.stdout = StringIO()
+    assert_equal('result', cli.command_async('fast'))
+    assert_raises(ExitLoop, cli.command_async, 'exit')
+
+    def interrupt():
+        started.wait()
+        time.sleep(0.05)
+        thread.interrupt_main()
+    threading.Thread(target=interrupt).start()
+
+    assert_equal(None, cli.command_async('slow', poll_interval=0.01))
+    assert_equal('fast\n% Command cancelled\n\n', cli.stdout.getvalue())
+
+
+def test_modes():
+    modes = CommandSet()
+
+    @modes.install('enable')
+    def _cmd_enable(cli, args):
+        cli.enter_mode('enable')
+
+    @modes.install('configure terminal', mode='enable')
+    def _cmd_configure(cli, args):
+        cli.enter_mode('configure')
+
+    @modes.install('end', mode='configure')
+    def _cmd_end(cli, args):
+        cli.exit_mode('enable')
+
+    @modes.install('exit', mode=['enable', 'configure'])
+    def _cmd_exit(cli, args):
+        raise ExitLoop()
+
+    cli = Cli('>')
+    cli.add_mode('enable', '#')
+    cli.add_mode('configure', '(config)#')
+    cli.load(modes)
+    cli.load(testcmd, mode=['enable', 'configure'])
+    cli.stdout = StringIO()
+
+    # Loaded once, shared by both modes
+    assert (cli.modes['enable'].root['show'] is
+            cli.modes['configure'].root['show'])
+    assert_not_in('show', cli.root)
+
+    assert cli.handle_line('enable')
+    assert_equal('#', cli.prompt)
+    assert cli.handle_line('conf t')
+    assert_equal('(config)#', cli.prompt)
+    assert cli.handle_line('show system')
+    assert_equal('System ok\n', cli.stdout.getvalue())
+    assert cli.handle_line('end')
+    assert_equal('#', cli.prompt)
+    assert cli.handle_line('exit')
+    assert_equal('>', cli.prompt)
+    assert not cli.exit_mode()
+
+    # ExitLoop from the bottom mode ends the loop
+    cli.enter_mode('enable')
+    assert cli.handle_line('exit')
+    cli.enter_mode('enable')
+    cli.enter_mode('configure')
+    cli.exit_mode('enable')
+    assert_equal(['#'], [m.prompt for m in cli._mode_stack[1:]])
+
+    # Sessions keep their own mode stack
+    session = cli.session(StringIO())
+    session.handle_line('conf t')
+    assert_equal('(config)#', session.prompt)
+    assert_equal('#', cli.prompt)
+
+
+def test_mode_copy_on_write():
+    extra = CommandSet()
+    extra.add(None, 'show clock', None)
+    more = CommandSet()
+    more.add(None, 'show users', None)
+
+    cli = Cli(command_sets=[testcmd])
+    assert_equal({}, cli.add_mode('empty', '%').root)
+    assert_raises(ValueError, cli.add_mode, 'empty', '%')
+
+    child = cli.add_mode('child', '$', parent=None)
+    show = cli.root['show']
+    assert child.root['show'] is show
+
+    # Each side copies the shared path before changing it
+    cli.load(extra, mode='child')
+    assert child.root['show'] is not show
+    assert child.root['test'] is cli.root['test']
+    assert child.root.lookup('show', 'clock') is not None
+    assert_equal(['system', 'version'], sorted(cli.root['show']))
+
+    cli.load(more)
+    assert_not_in('users', child.root['show'])
+    assert_not_in('clock', cli.root['show'])
+    assert child.root['show']['system'] is cli.root['show']['system']
+
+    # Rollback restores the shared root
+    before = child.root
+    broken = CommandSet()
+    broken.add(None, 'test (unbalanced', None)
+    cli.add_mode('grandchild', '&', parent='child')
+    assert_raises(ValueError, cli.load, broken, mode='grandchild')
+    assert cli.modes['grandchild'].root['test'] is before['test']
+
+    cli.freeze()
+    assert_equal(['clock', 'system', 'version'],
+                 sorted(cli.modes['child'].root.lookup('show').children()))
+    assert (cli.modes['child'].root.lookup('test') is
+            cli.modes['grandchild'].root.lookup('test'))
+
 if __name__ == '__main__':
     TestCli().cli.commandloop()
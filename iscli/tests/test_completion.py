@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+
+from nose.tools import assert_equal
+
+from iscli.cli import Cli, CommandSet
+from iscli.completion import CompletionCache
+
+
+commands = CommandSet()
+
+
+@commands.install('show interface IFNAME (detail|)')
+def _cmd_show_interface(cli, args):
+    pass
+
+
+@commands.install('ping HOSTNAME')
+def _cmd_ping(cli, args):
+    pass
+
+
+@commands.completer('IFNAME')
+def _complete_ifname(cli):
+    return ['Gi0/1', 'Gi0/2', 'Te1/1']
+
+
+class Provider(object):
+    """Counts its calls, and blocks while ``gate`` is clear"""
+    def __init__(self, values):
+        self.values = values
+        self.calls = 0
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def __call__(self, *args):
+        self.calls += 1
+        self.gate.wait()
+        if isinstance(self.values, Exception):
+            raise self.values
+        return list(self.values)
+
+
+def test_cli_complete():
+    cli = Cli(command_sets=[commands])
+    assert_equal(['Gi0/1', 'Gi0/2', 'Te1/1'],
+                 cli.complete('show interface ', ''))
+    assert_equal(['Gi0/1', 'Gi0/2'], cli.complete('show interface G', 'G'))
+    assert_equal(['Gi0/1', 'Gi0/2'],
+                 cli.complete('show interface Gi0/', 'Gi0/'))
+    assert_equal(['detail'], cli.complete('show interface Gi0/1 ', ''))
+
+    # Arguments without a provider still complete to nothing
+    assert_equal([], cli.complete('ping ', ''))
+    hosts = Provider(['router', 'switch'])
+    cli.add_completer('HOSTNAME', hosts)
+    assert_equal(['router'], cli.complete('ping r', 'r'))
+    cli.complete('ping ', '')
+    assert_equal(1, hosts.calls)
+
+
+def test_cache_ttl():
+    cache = CompletionCache(ttl=0.05)
+    provider = Provider(['a'])
+    assert_equal(('a',), cache.get('key', provider))
+    assert_equal(('a',), cache.get('key', provider))
+    assert_equal(1, provider.calls)
+
+    # Expired results are returned while they are refreshed
+    time.sleep(0.06)
+    provider.values = ['b']
+    provider.gate.clear()
+    assert_equal(('a',), cache.get('key', provider))
+    provider.gate.set()
+    time.sleep(0.02)
+    assert_equal(('b',), cache.get('key', provider))
+    assert_equal(2, provider.calls)
+
+
+def test_cache_never_blocks():
+    cache = CompletionCache(wait=0)
+    provider = Provider(['a'])
+    provider.gate.clear()
+    start = time.time()
+    assert_equal((), cache.get('key', provider))
+    assert_equal((), cache.get('key', provider))
+    assert time.time() - start < 0.05
+    provider.gate.set()
+    time.sleep(0.02)
+    assert_equal(('a',), cache.get('key', provider))
+    assert_equal(1, provider.calls)
+
+
+def test_cache_errors_and_lru():
+    cache = CompletionCache(ttl=0, size=2)
+    provider = Provider(['a'])
+    assert_equal(('a',), cache.get('key', provider))
+    provider.values = RuntimeError('down')
+    cache.get('key', provider)
+    time.sleep(0.02)
+    assert_equal(('a',), cache.get('key', provider))
+
+    cache.get('other', Provider(['b']))
+    cache.get('key', provider)
+    cache.get('third', Provider(['c']))
+    assert_equal(['key', 'third'], list(cache._entries))
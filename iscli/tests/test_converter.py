@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+import socket
+from StringIO import StringIO
+
+from nose.tools import assert_equal
+
+from iscli import converter
+from iscli.cli import Cli, CommandSet
+from iscli.converter import create_converter, register_converter
+
+
+def check(spec, accepted, rejected):
+    convert = create_converter(spec)
+    for arg in accepted:
+        assert_equal(True, convert(arg)[0], '%s %r' % (spec, arg))
+    for arg in rejected:
+        assert_equal(False, convert(arg)[0], '%s %r' % (spec, arg))
+
+
+def test_ranges():
+    assert_equal((True, 10), create_converter('<1-10>')('010'))
+    check('<1-10>', ['1', '10'],
+          ['0', '11', '-1', '+5', ' 5', 'x', '', u'\xb2', '9' * 30])
+    assert_equal((True, 31), create_converter('<0x0-0xff>')('0x1f'))
+    check('<0x10-0xff>', ['0x10', '0XfF', '0x00ff'],
+          ['0xf', '0x100', 'ff', '0x', '16'])
+    check('WORD<2-4>', ['ab', 'abcd'], ['a', 'abcde'])
+
+
+def test_addresses():
+    check('A.B.C.D', ['10.0.0.1', '255.255.255.255'],
+          ['256.0.0.1', '1.2.3', '1.2.3.4.5', '1..2.3', 'a.b.c.d', ''])
+    check('A.B.C.D/M', ['10.0.0.0/8', '0.0.0.0/0'],
+          ['10.0.0.0/33', '10.0.0.0/', '10.0.0.0', '10.0.0/8'])
+    check('X:X::X:X/M', ['fe80::/10', '::/0'], ['fe80::/129', 'fe80::'])
+    check('H.H.H', ['0011.2233.aAbB'], ['0011.2233', '0011.2233.445g'])
+    check('XX:XX:XX:XX:XX:XX', ['00:11:22:33:44:55'],
+          ['00:11:22:33:44', '00-11-22-33-44-55'])
+    check('CISCO_IFNAME', ['Gi0/1/2', 'eth0', 'Port-channel1.100'],
+          ['0/1', 'Gi', 'Gi0/'])
+    check('IFNAME', ['Gi0/1/2', 'lo', 'enp0s3', 'wlp2s0', 'br-lan',
+                     'veth1a2b'], [])
+
+
+def test_ipv6_like_inet_pton():
+    convert = create_converter('X:X::X:X')
+    for arg in ['::', '::1', '1::', 'fe80::1', '2001:db8::8a2e:370:7334',
+                '1:2:3:4:5:6:7:8', '1:2:3:4:5:6:7:8:9', '1::2::3', ':1',
+                '1:', '::ffff:1.2.3.4', '::1.2.3.4', '1::1.2.3.4',
+                '1:2:3:4:5:6:1.2.3.4', '1:2:3:4:5:6:7:1.2.3.4', '12345::',
+                'g::1', '1:::2', '1.2.3.4', ':::', '1:2:3:4:5:6:7::',
+                '1:2:3:4:5:6:7:8::']:
+        try:
+            socket.inet_pton(socket.AF_INET6, arg)
+            valid = True
+        except socket.error:
+            valid = False
+        assert_equal(valid, convert(arg)[0], arg)
+
+
+def test_shared():
+    assert create_converter('<1-10>') is create_converter('<1-10>')
+    assert create_converter('WORD') is create_converter('HOSTNAME')
+    assert_equal(None, create_converter('show'))
+
+
+def test_register_converter():
+    registered = list(converter.CONVERTERS)
+    try:
+        @register_converter(r'VLAN$')
+        def vlan_converter(spec):
+            return lambda arg: (arg.startswith('vlan'), arg[4:])
+
+        commands = CommandSet()
+        commands.add(lambda cli, args: cli.out(args), 'show VLAN', None)
+        cli = Cli(command_sets=[commands])
+        cli.stdout = StringIO()
+        cli.command('show vlan10')
+        cli.command('show 10')
+        assert_equal("['10']\n% Unrecognized command\n\n",
+                     cli.stdout.getvalue())
+    finally:
+        converter.CONVERTERS[:] = registered
+        converter._converters.clear()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from nose.tools import assert_equal
+
+from iscli.cli import Cli
+from iscli.history import History, Index, history_commands
+
+
+def test_index():
+    index = Index()
+    for line in ('show ip route', 'show version', 'ping 10.0.0.1',
+                 'show ip route', 'ping 10.0.0.2', 'show ip bgp'):
+        index.add(line)
+    expected = ['show ip bgp', 'show ip route', 'show version']
+    assert_equal(expected, list(index.search('show')))
+    assert_equal(['ping 10.0.0.2', 'ping 10.0.0.1'],
+                 list(index.search('10.0')))
+    assert_equal(['show ip route'], list(index.search('route')))
+    assert_equal([], list(index.search('nothing')))
+    assert_equal(5, len(list(index.search(''))))
+
+    # Sorting the candidates gives the same order as the scan
+    index.dense = 1.0
+    assert_equal(expected, list(index.search('show')))
+    assert_equal(['show ip route'], list(index.search('route')))
+    index.dense = 0.0
+    assert_equal(expected, list(index.search('show')))
+
+
+class TestHistory(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'history')
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def journal(self):
+        with open(self.path) as f:
+            return f.read().split('\n')[:-1]
+
+    def test_journal(self):
+        first = History(self.path, size=3)
+        second = History(self.path, size=3)
+        for line in ('a', 'b', 'b', 'c', 'd'):
+            first.add(line)
+        second.add('e')
+        assert_equal(['b', 'c', 'd'], list(first.recent))
+        assert_equal(['a', 'b', 'c', 'd', 'e'], self.journal())
+
+        # Only the tail is read
+        third = History(self.path, size=2)
+        assert_equal(['d', 'e'], list(third.recent))
+        assert_equal(['e', 'd', 'c', 'b', 'a'], list(third.search('')))
+        third.add('a')
+        assert_equal(['a', 'e', 'd'], list(third.search(''))[:3])
+        for history in (first, second, third):
+            history.close()
+
+    def test_large_tail(self):
+        with open(self.path, 'w') as f:
+            for i in xrange(50000):
+                f.write('show interface eth%d\n' % i)
+        history = History(self.path, size=5)
+        assert_equal(['show interface eth%d' % i
+                      for i in xrange(49995, 50000)], list(history.recent))
+        found = list(history.search('eth4999'))
+        assert_equal(['show interface eth4999%d' % i
+                      for i in reversed(xrange(10))] +
+                     ['show interface eth4999'], found)
+        history.close()
+
+    def test_compact(self):
+        with open(self.path, 'w') as f:
+            for i in xrange(10):
+                f.write('ping %d\nshow version\n' % i)
+        other = History(self.path)
+        history = History(self.path, limit=4)
+        history.search('')  # waits for indexing and compaction
+        assert_equal(['ping 7', 'ping 8', 'ping 9', 'show version'],
+                     self.journal())
+
+        # Sessions holding the old file append to the new one
+        other.add('show clock')
+        history.add('show users')
+        assert_equal(['ping 7', 'ping 8', 'ping 9', 'show version',
+                      'show clock', 'show users'], self.journal())
+        other.close()
+        history.close()
+
+    def test_unwritable(self):
+        history = History(os.path.join(self.directory, 'missing', 'h'))
+        history.add('show version')
+        assert_equal(['show version'], list(history.search('ver')))
+
+    def test_commands(self):
+        cli = Cli(command_sets=[history_commands], history=self.path)
+        for line in ('show version', 'show clock', 'ping 1.1.1.1'):
+            cli.history.add(line)
+        cli.stdout = StringIO()
+        cli.command('show history')
+        cli.command('show history search show')
+        assert_equal('  show version\n  show clock\n  ping 1.1.1.1\n'
+                     '  show clock\n  show version\n',
+                     cli.stdout.getvalue())
+        cli.history.close()
+
+        # Without a journal
+        cli = Cli(command_sets=[history_commands])
+        cli.history.add('show version')
+        cli.stdout = StringIO()
+        cli.command('show history')
+        assert_equal('  show version\n', cli.stdout.getvalue())
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+from StringIO import StringIO
+
+from nose.tools import assert_equal
+
+from iscli.cli import Cli, CommandSet
+from iscli.pager import Pager
+
+
+class Routes(object):
+    """Generator handler recording how far it got"""
+    def __init__(self, count):
+        self.count = count
+        self.generated = 0
+        self.closed = False
+
+    def __call__(self, cli, args):
+        try:
+            for i in xrange(self.count):
+                self.generated += 1
+                yield 'route %d' % i
+        finally:
+            self.closed = True
+
+
+def make_cli(routes, keys=None):
+    commands = CommandSet()
+    commands.add(routes, 'show routes', None)
+    cli = Cli(command_sets=[commands])
+    cli.stdout = StringIO()
+    if keys is not None:
+        keys = iter(keys)
+        cli.pager = Pager(4, lambda: next(keys, ''), cli.stdout)
+    return cli
+
+
+def lines(cli):
+    # Drop the erased --More-- prompts
+    output = [l.rsplit('\r', 1)[-1]
+              for l in cli.stdout.getvalue().split('\n')]
+    return [l for l in output if l.startswith('route')]
+
+
+def test_no_pager():
+    routes = Routes(10)
+    cli = make_cli(routes)
+    assert_equal(None, cli.command('show routes'))
+    assert_equal(['route %d' % i for i in xrange(10)], lines(cli))
+    assert routes.closed
+
+
+def test_quit():
+    routes = Routes(100000)
+    cli = make_cli(routes, ' q')
+    cli.command('show routes')
+
+    # A screen of 3 lines, another screen, then nothing more generated
+    assert_equal(6, len(lines(cli)))
+    assert_equal(6, routes.generated)
+    assert routes.closed
+    assert_equal(2, cli.stdout.getvalue().count(Pager.prompt))
+
+
+def test_keys():
+    routes = Routes(8)
+    cli = make_cli(routes, '\r  ')
+    cli.command('show routes')
+    assert_equal(['route %d' % i for i in xrange(8)], lines(cli))
+    # 3 lines, 1 for return, then 3 and the last one for space
+    assert_equal(3, cli.stdout.getvalue().count(Pager.prompt))
+
+    # End of input quits
+    routes = Routes(8)
+    cli = make_cli(routes, '')
+    cli.command('show routes')
+    assert_equal(3, routes.generated)
+
+
+def test_script_and_async():
+    routes = Routes(10)
+    cli = make_cli(routes, 'q')
+    cli.session(StringIO()).run_script(['show routes'])
+    assert_equal(10, routes.generated)
+
+    routes = Routes(10)
+    cli = make_cli(routes, 'q')
+    cli.command_async('show routes')
+    assert_equal(3, routes.generated)
+    assert routes.closed
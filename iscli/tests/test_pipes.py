@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+import thread
+import threading
+import time
+from StringIO import StringIO
+
+from nose.tools import assert_equal, assert_raises
+
+from iscli.cli import Cli, CommandSet
+from iscli.exceptions import InvalidPipe
+from iscli.pager import Pager
+from iscli.pipes import split_pipes
+
+CONFIG = '''hostname r1
+interface eth0
+ description uplink
+ ip address 10.0.0.1/24
+interface eth1
+ shutdown
+router bgp 65000
+ neighbor 10.0.0.2 remote-as 65001
+ address-family ipv4
+  neighbor 10.0.0.2 activate
+end'''.split('\n')
+
+
+class Config(object):
+    """Generator handler recording how far it got"""
+    def __init__(self, repeat=1):
+        self.repeat = repeat
+        self.generated = 0
+        self.closed = False
+
+    def __call__(self, cli, args):
+        try:
+            for _ in xrange(self.repeat):
+                for line in CONFIG:
+                    self.generated += 1
+                    yield line
+        finally:
+            self.closed = True
+
+
+def make_cli(config=None):
+    commands = CommandSet()
+    commands.add(config or Config(), 'show running-config', None)
+    commands.add(lambda cli, args: [cli.out(l) for l in CONFIG] and None,
+                 'show printed', None)
+    commands.add(lambda cli, args: cli.out(' '.join(args)), 'echo .WORD',
+                 None)
+    cli = Cli(command_sets=[commands])
+    cli.stdout = StringIO()
+    return cli
+
+
+def run(cli, line):
+    cli.stdout = StringIO()
+    cli.command(line)
+    return cli.stdout.getvalue().split('\n')[:-1]
+
+
+def test_filters():
+    for show in ('sh run', 'show printed'):
+        cli = make_cli()
+        assert_equal(['interface eth0', 'interface eth1'],
+                     run(cli, show + ' | include ^interface'))
+        assert_equal(['hostname r1', 'router bgp 65000', 'end'],
+                     run(cli, show + ' | exclude ^(interface| )'))
+        assert_equal(CONFIG[6:], run(cli, show + ' | be bgp'))
+        assert_equal(CONFIG[1:4] + CONFIG[6:10],
+                     run(cli, show + ' | section eth0|bgp'))
+        assert_equal(['Number of lines = 11'], run(cli, show + ' | count'))
+        assert_equal(['Number of lines which match regexp = 3'],
+                     run(cli, show + ' | count neighbor|hostname'))
+
+        # Chained, the regexp spans words
+        assert_equal([' neighbor 10.0.0.2 remote-as 65001'],
+                     run(cli, show + ' | sec bgp | inc remote-as 65001'))
+        assert_equal(['Number of lines = 2'],
+                     run(cli, show + ' | sec bgp | inc neighbor | count'))
+
+
+def test_split():
+    assert_equal(('echo a|b', None), split_pipes('echo a|b'))
+    assert_equal(('echo "|"', None), split_pipes('echo "|"'))
+    line, pipeline = split_pipes('echo "a | b" | include  x  y | inc "y  z"')
+    assert_equal('echo "a | b"', line)
+    assert_equal(['x y  z'],
+                 list(pipeline.filter(['x  y  z', 'x y  z', 'x y z'])))
+
+    cli = make_cli()
+    assert_equal(['a | b'], run(cli, 'echo "a | b" | include a'))
+    for line in ('echo a |', 'echo a | include', 'echo a | bogus x',
+                 'echo a | include (', 'echo a | | count'):
+        assert_raises(InvalidPipe, split_pipes, line)
+        assert_equal(['% Invalid output filter', ''], run(cli, line))
+        result = cli.session(StringIO()).run_script([line])
+        assert_equal('InvalidPipe: ' + line, result.errors[0].error)
+
+
+def test_streaming():
+    # count pulls every line, one at a time
+    config = Config(100000)
+    cli = make_cli(config)
+    assert_equal(['Number of lines = %d' % (len(CONFIG) * 100000)],
+                 run(cli, 'show running-config | count'))
+    assert config.closed
+
+    # Quitting the pager stops the handler
+    config = Config(100000)
+    cli = make_cli(config)
+    keys = iter('q')
+    cli.pager = Pager(4, lambda: next(keys, ''), StringIO())
+    output = run(cli, 'show running-config | include ^interface')
+    assert_equal(['interface eth0', 'interface eth1', 'interface eth0'],
+                 output)
+    assert config.generated < 50
+    assert config.closed
+
+
+def test_cancel():
+    # Ctrl-C leaves the Cli's stdout as it was, and what the cancelled
+    # command writes afterwards is dropped
+    started = threading.Event()
+    done = threading.Event()
+
+    def slow(cli, args):
+        cli.stdout.write('early\n')
+        started.set()
+        while not cli.cancelled():
+            time.sleep(0.01)
+        cli.stdout.write('late\n')
+        done.set()
+
+    commands = CommandSet()
+    commands.add(slow, 'show slow', None)
+    cli = make_cli()
+    cli.load(commands)
+    stdout = cli.stdout
+
+    def interrupt():
+        started.wait()
+        time.sleep(0.05)
+        thread.interrupt_main()
+    threading.Thread(target=interrupt).start()
+
+    cli.command_async('show slow | include a', poll_interval=0.01)
+    assert done.wait(5)
+    assert cli.stdout is stdout
+    assert_equal('early\n% Command cancelled\n\n', stdout.getvalue())
+    assert_equal(['a'], run(cli, 'echo a'))
+
+
+def test_help():
+    cli = make_cli()
+    assert_equal(['begin', 'count', 'exclude', 'include', 'section'],
+                 cli.complete('show run | ', ''))
+    assert_equal(['exclude'], cli.complete('show run | e', 'e'))
+    assert_equal([], cli.complete('show run | include ', ''))
+
+    cli.stdout = StringIO()
+    cli.describe('show run | c')
+    assert_equal('    count    Count number of lines which match\n\n',
+                 cli.stdout.getvalue())
+    cli.stdout = StringIO()
+    cli.describe('show run | count ')
+    assert_equal(['LINE', '<cr>'],
+                 [l.split()[0] for l in cli.stdout.getvalue().split('\n')
+                  if l])
+
+    # Nothing after the bar yet lists every filter
+    names = ['begin', 'count', 'exclude', 'include', 'section']
+    for describe in (lambda: cli.describe('show run |'),
+                     lambda: cli.handle_line('show run |?')):
+        cli.stdout = StringIO()
+        describe()
+        assert_equal(names, [l.split()[0] for l in
+                             cli.stdout.getvalue().split('\n') if l])
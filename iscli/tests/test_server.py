@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import socket
+import tempfile
+import threading
+
+from nose.tools import assert_equal, assert_in
+
+from iscli.cli import Cli
+from iscli.node import FrozenNode
+from iscli.server import make_server
+from iscli.tests.test_cli import testcmd
+
+
+class Client(object):
+    def __init__(self, address, prompt):
+        self.sock = socket.socket(socket.AF_UNIX)
+        self.sock.connect(address)
+        self.prompt = prompt
+        self.read()
+
+    def read(self):
+        data = ''
+        while not data.endswith(self.prompt):
+            chunk = self.sock.recv(4096)
+            if not chunk:
+                break
+            data += chunk
+        return data[:-len(self.prompt)]
+
+    def send(self, line):
+        self.sock.sendall(line + '\n')
+        return self.read()
+
+
+class TestServer(object):
+    def setup(self):
+        self.tmp = tempfile.mkdtemp()
+        self.address = os.path.join(self.tmp, 'cli.sock')
+        self.cli = Cli('test> ', command_sets=[testcmd])
+        self.server = make_server(self.cli, self.address)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+
+    def teardown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tmp)
+
+    def test_sessions(self):
+        assert isinstance(self.cli.root, FrozenNode)
+        a = Client(self.address, 'test> ')
+        b = Client(self.address, 'test> ')
+
+        assert_in('System ok', a.send('sh sys'))
+        assert_in('Version 1.0', b.send('show version'))
+        assert_in('Ambiguous', a.send('s'))
+        assert_in('Unrecognized', b.send('bogus'))
+        assert_in('Software version', a.send('show ?'))
+        assert_equal('system  version\n', b.send('show \t'))
+
+        # Output goes to the session's own connection only
+        assert_equal('System ok\n', b.send('show system'))
+        assert_equal('Version 1.0\n', a.send('show version'))
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+from StringIO import StringIO
+
+from nose.tools import assert_equal, assert_not_equal
+
+from iscli import snapshot
+from iscli.cli import Cli, CommandSet
+
+
+def make_commands(greeting):
+    commands = CommandSet()
+
+    @commands.install('show greeting', ['Show', 'Greeting'])
+    def _cmd_show_greeting(cli, args):
+        cli.out(greeting)
+
+    @commands.install('mount HOST {ro | uid <1-100>} (now|)')
+    def _cmd_mount(cli, args):
+        cli.out('mount %s %r' % (greeting, args))
+
+    @commands.install('echo .WORD')
+    def _cmd_echo(cli, args):
+        cli.out(' '.join(args))
+
+    return commands
+
+
+class TestSnapshot(object):
+    def setup(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'tree')
+
+    def teardown(self):
+        shutil.rmtree(self.directory)
+
+    def run(self, cli, *lines):
+        cli.stdout = StringIO()
+        for line in lines:
+            cli.command(line)
+        return cli.stdout.getvalue()
+
+    def test_rebinds_handlers(self):
+        built = Cli(command_sets=[make_commands('hello')], cache=self.path)
+        assert os.path.exists(self.path)
+        mtime = os.stat(self.path).st_mtime
+
+        # Same specs, new handler functions
+        loaded = Cli(command_sets=[make_commands('bye')], cache=self.path)
+        assert_equal(mtime, os.stat(self.path).st_mtime)
+        assert_equal(
+            'bye\nmount bye [\'h\', \'uid\', 5, \'ro\']\na b\n',
+            self.run(loaded, 'sh gr', 'mount h uid 5 ro', 'echo a b'))
+        assert_equal(self.run(built, 'sh gr ?', 'mount h ?').replace(
+            'hello', 'bye'), self.run(loaded, 'sh gr ?', 'mount h ?'))
+        assert_equal(['now', 'uid'], loaded.complete('mount h ro ', ''))
+
+    def test_invalidated(self):
+        Cli(command_sets=[make_commands('hello')], cache=self.path)
+        key = snapshot.command_key([make_commands('hello')])
+
+        changed = make_commands('hello')
+        changed.add(lambda cli, args: cli.out('version'), 'show version',
+                    None)
+        assert_not_equal(key, snapshot.command_key([changed]))
+        cli = Cli(command_sets=[changed], cache=self.path)
+        assert_equal('version\n', self.run(cli, 'show version'))
+        assert_equal(None, snapshot.load(self.path, key, []))
+
+        with open(self.path, 'w') as f:
+            f.write('garbage')
+        cli = Cli(command_sets=[changed], cache=self.path)
+        assert_equal('version\n', self.run(cli, 'show version'))
+
+    def test_modes_and_on_load(self):
+        commands = make_commands('hello')
+        loaded = []
+        commands.add(lambda cli, args: cli.out('enabled'), 'enabled',
+                     None, mode='enable')
+
+        @commands.on_load
+        def _on_load(cli):
+            loaded.append(cli)
+            cli.register(lambda cli, args: cli.out('extra'), 'extra', None)
+
+        for _ in xrange(2):
+            cli = Cli()
+            cli.add_mode('enable', '#')
+            cli.load(commands, cache=self.path)
+            assert_equal('hello\nextra\n', self.run(cli, 'sh gr', 'extra'))
+            cli.enter_mode('enable')
+            assert_equal('enabled\n', self.run(cli, 'enabled'))
+        assert_equal(2, len(loaded))
+
+    def test_safe_commands(self):
+        commands = make_commands('hello')
+
+        @commands.install('show mounts {ro | uid <1-100>}', safe=True)
+        def _cmd_show_mounts(cli, args):
+            cli.out('mounts %r' % (args,))
+
+        Cli(command_sets=[commands], cache=self.path)
+        cli = Cli()
+        registered = []
+        cli.register = lambda *args, **options: registered.append(args)
+        cli.load(commands, cache=self.path)
+        assert_equal([], registered)
+        assert_equal(1, len(cli.root.lookup('show', 'mounts').option_sets))
+        assert _cmd_show_mounts in cli.safe_handlers
+        assert_equal("mounts ['uid', 5, 'ro']\n",
+                     self.run(cli, 'show mounts uid 5 ro'))
+
+    def test_unwritable(self):
+        path = os.path.join(self.directory, 'missing', 'tree')
+        cli = Cli(command_sets=[make_commands('hello')], cache=path)
+        assert_equal('hello\n', self.run(cli, 'sh gr'))
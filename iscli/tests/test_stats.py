@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+import time
+from StringIO import StringIO
+
+from nose.tools import assert_equal, assert_in, assert_raises
+
+from iscli.cli import Cli, CommandSet
+from iscli.exceptions import ExitLoop
+from iscli.node import CliElement, CliNode
+from iscli.stats import ConverterTimer, Histogram, statistics_commands
+from iscli.tests.test_cli import testcmd
+
+
+failing = CommandSet()
+
+
+@failing.install('fail')
+def _cmd_fail(cli, args):
+    raise RuntimeError('failed')
+
+
+@failing.install('quit')
+def _cmd_quit(cli, args):
+    raise ExitLoop()
+
+
+def test_histogram():
+    histogram = Histogram()
+    assert_equal(0.0, histogram.percentile(50))
+    for us in [3, 3, 3, 100]:
+        histogram.add(us / 1e6)
+    assert_equal(4, histogram.count)
+    assert_equal([0, 0, 3, 0, 0, 0, 0, 1], histogram.buckets[:8])
+    assert_equal(4e-6, histogram.percentile(50))
+    assert_equal(100e-6, histogram.percentile(99))
+
+
+def test_statistics():
+    cli = Cli(command_sets=[testcmd, failing])
+    cli.stdout = StringIO()
+    assert cli.statistics is None
+
+    statistics = cli.enable_statistics()
+    assert cli.enable_statistics() is statistics
+
+    for line in ['show system', 'test range 5', 'test vararg a b', 'bogus',
+                 's']:
+        cli.command(line)
+    assert_raises(RuntimeError, cli.command, 'fail')
+    assert_raises(ExitLoop, cli.command, 'quit')
+    cli.run_script(['show version', 'test range 2'])
+    cli.session(StringIO()).command('show system')
+
+    assert_equal({'lines': 10, 'unrecognized': 1, 'ambiguous': 1,
+                  'errors': 1},
+                 dict(statistics.counters))
+    data = statistics.as_dict()
+    for phase in ('parse', 'expand', 'convert', 'handler', 'total'):
+        assert_equal(8, data['phases'][phase]['count'])
+    assert_equal(
+        {'show system': 2, 'show version': 1, 'test range <1-10>': 2,
+         'test vararg .WORD': 1, 'fail': 1, 'quit': 1},
+        {name: h['count'] for name, h in data['commands'].iteritems()})
+    assert data['phases']['convert']['total'] > 0
+
+    statistics.reset()
+    assert_equal({}, statistics.as_dict()['commands'])
+
+    cli.disable_statistics()
+    cli.command('show system')
+    assert cli.statistics is None
+
+
+def test_converter_timer():
+    # Only the walk given the timer is timed, through the nodes' own parse
+    class SlowNode(CliNode):
+        def parse(self, fragment):
+            time.sleep(0.01)
+            return CliNode.parse(self, fragment)
+
+    cli = Cli(command_sets=[testcmd])
+    cli.stdout = StringIO()
+    node = cli.root.lookup('test', 'range')
+    node['<1-10>'] = SlowNode(CliElement('<1-10>'), node['<1-10>'].fn)
+    cli.tree_changed()
+
+    timer = ConverterTimer()
+    assert_equal([7], node.match('7').keys())
+    assert_equal(0.0, timer.elapsed)
+    assert_equal([7], node.match('7', timer).keys())
+    assert timer.elapsed >= 0.01
+
+    statistics = cli.enable_statistics()
+    cli.command('test range 7')
+    assert statistics.as_dict()['phases']['convert']['total'] >= 0.01
+
+
+def test_show_cli_statistics():
+    cli = Cli(command_sets=[testcmd, statistics_commands])
+    cli.stdout = StringIO()
+    assert cli.statistics is not None
+
+    cli.command('show system')
+    cli.command('show cli statistics')
+    output = cli.stdout.getvalue()
+    assert_in('Lines: 2, unrecognized: 0', output)
+    assert_in('\ntotal ', output)
+    assert_in('\nshow system ', output)
+
+    cli.command('clear cli statistics')
+    assert_equal(['clear cli statistics'],
+                 cli.statistics.as_dict()['commands'].keys())
+
+    cli.disable_statistics()
+    cli.command('show cli statistics')
+    assert_in('Statistics are disabled', cli.stdout.getvalue())
+
+
+def test_generator_handler():
+    commands = CommandSet()
+
+    @commands.install('show slow')
+    def _cmd_show_slow(cli, args):
+        for i in xrange(2):
+            time.sleep(0.01)
+            yield str(i)
+
+    cli = Cli(command_sets=[commands])
+    cli.stdout = StringIO()
+    statistics = cli.enable_statistics()
+    cli.command('show slow')
+    assert_equal('0\n1\n', cli.stdout.getvalue())
+    handler = statistics.as_dict()['phases']['handler']
+    assert_equal(1, handler['count'])
+    assert handler['total'] >= 0.02
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+
+import shlex
+
+from nose.tools import assert_equal, assert_raises
+
+from iscli.tokenizer import Token, split, tokenize
+
+
+LINES = [
+    '',
+    '   ',
+    'show ip route',
+    '  show\tip  route ',
+    'a"b c"d',
+    "x '' y",
+    'esc\\ aped "dq \\" \\\\ \\n" \'sq \\\'',
+    'путь "к файлу"',
+]
+
+
+def test_split_like_shlex():
+    for line in LINES:
+        assert_equal(tuple(shlex.split(line)), split(line))
+
+
+def test_spans():
+    line = 'show "ip  route" x'
+    assert_equal([
+        Token('show', 0, 4, False, None),
+        Token('ip  route', 5, 16, True, None),
+        Token('x', 17, 18, False, None),
+    ], tokenize(line))
+
+
+def test_unterminated():
+    for line, text, quote in [
+        ('show "ip ro', 'ip ro', '"'),
+        ("show 'ip ", 'ip ', "'"),
+        ('show ip\\', 'ip', '\\'),
+    ]:
+        token = tokenize(line)[-1]
+        assert_equal((text, quote, len(line)),
+                     (token.text, token.open, token.end))
+        assert_raises(ValueError, split, line)
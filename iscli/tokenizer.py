@@ -0,0 +1,121 @@
+"""
+iscli.tokenizer
+~~~~~~~~~~~~~~~
+
+Split a command line into tokens in a single pass.
+
+The rules follow :func:`shlex.split` in POSIX mode: words are separated by
+whitespace, single quotes preserve everything up to the closing quote,
+double quotes preserve everything but ``\\"`` and ``\\\\`` escapes, and a
+backslash outside quotes escapes the next character.
+
+Unlike :mod:`shlex` every token keeps its position in the line, and an
+unterminated quote or escape at the end of the line is reported on the
+last token rather than raised, which is what completion and help need
+while the user is still typing.
+"""
+import collections
+import re
+
+
+class Token(collections.namedtuple('Token', 'text start end quoted open')):
+    """A word of a command line.
+
+    :param text: word with quotes and escapes removed
+    :param start: offset of the first character of the word in the line
+    :param end: offset just past the last character of the word
+    :param quoted: True if any part of the word was quoted or escaped
+    :param open: quote character (or backslash) left open at the end of
+                 the line, else None
+    """
+    __slots__ = ()
+
+
+PIECE_RE = re.compile(r'''
+    (?P<space>[ \t\r\n]+)
+  | (?P<plain>[^ \t\r\n'"\\]+)
+  | '(?P<single>[^']*)(?P<single_end>'?)
+  | "(?P<double>(?:[^"\\]|\\.)*)(?P<double_escape>\\?)(?P<double_end>"?)
+  | \\(?P<escape>.?)
+''', re.VERBOSE | re.DOTALL)
+
+DOUBLE_ESCAPE_RE = re.compile(r'\\(["\\])')
+
+# Lines without quotes or escapes are split on whitespace alone
+SPECIAL_RE = re.compile(r'[\'"\\]')
+WORD_RE = re.compile(r'[^ \t\r\n]+')
+
+
+def tokenize(line):
+    """Split a line into :class:`Token` objects.
+
+    :param line: command line
+    :returns: list of tokens
+    """
+    if not SPECIAL_RE.search(line):
+        return [
+            Token(m.group(), m.start(), m.end(), False, None)
+            for m in WORD_RE.finditer(line)
+        ]
+
+    tokens = []
+    append = tokens.append
+    parts = []
+    start = None
+    quoted = False
+    open_quote = None
+    end = 0
+
+    for m in PIECE_RE.finditer(line):
+        kind = m.lastgroup
+        if kind == 'space':
+            if parts:
+                append(Token(''.join(parts), start, m.start(), quoted, None))
+                parts = []
+            start = None
+            quoted = False
+            continue
+
+        if start is None:
+            start = m.start()
+        end = m.end()
+        if kind == 'plain':
+            parts.append(m.group('plain'))
+            continue
+
+        quoted = True
+        text = m.group(kind)
+        if kind == 'single_end':
+            parts.append(m.group('single'))
+            if not text:
+                open_quote = "'"
+        elif kind == 'double_end':
+            if not text:
+                open_quote = '"'
+            parts.append(DOUBLE_ESCAPE_RE.sub(r'\1', m.group('double')))
+        else:
+            parts.append(text)
+            if not text:
+                open_quote = '\\'
+
+    if start is not None:
+        append(Token(''.join(parts), start, end, quoted, open_quote))
+    return tokens
+
+
+def split(line):
+    """Split a line into words, like :func:`shlex.split`.
+
+    :param line: command line
+    :returns: tuple of words
+    :raises ValueError: on an unterminated quote or escape
+    """
+    if not SPECIAL_RE.search(line):
+        return tuple(WORD_RE.findall(line))
+
+    tokens = tokenize(line)
+    if tokens and tokens[-1].open:
+        if tokens[-1].open == '\\':
+            raise ValueError('No escaped character')
+        raise ValueError('No closing quotation')
+    return tuple(token.text for token in tokens)
@@ -2,11 +2,9 @@
 
 from setuptools import setup
 
-import iscli.linenoise
-
 
 install_requires = [
-    'cffi >= 0.8',
+    'cffi >= 1.4',
 ]
 test_requires = [
     'nose',
@@ -21,7 +19,13 @@ setup(
     author_email='ridgefs@gmail.com',
     include_package_data=True,
     zip_safe=False,
-    ext_modules=[iscli.linenoise.ffi.verifier.get_extension()],
+    setup_requires=install_requires,
+    cffi_modules=['iscli/linenoise_build.py:ffibuilder'],
+    entry_points={
+        'console_scripts': [
+            'iscli-run = iscli.run:main',
+        ],
+    },
     install_requires=install_requires,
     test_requires=test_requires,
     test_suite='nose.collector',